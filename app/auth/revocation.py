@@ -0,0 +1,133 @@
+import math
+import time
+import asyncio
+import hashlib
+import logging
+
+from app.core import cache
+from app.core.config import settings
+from app.metrics import token_revocation_checks
+
+logger = logging.getLogger(__name__)
+
+REVOKED_SET = "revoked_jtis"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+_bloom = BloomFilter(
+    settings.revocation_bloom_capacity, settings.revocation_bloom_error_rate
+)
+# Until the first sync from Redis completes, the filter can't vouch for a
+# token, so every check goes to Redis.
+_synced = False
+_sync_task: asyncio.Task | None = None
+# Jtis revoked while a sync is reading its snapshot, carried into the new filter.
+_pending: list[str] | None = None
+
+
+def _on_revoked(jti: str):
+    _bloom.add(jti)
+    if _pending is not None:
+        _pending.append(jti)
+
+
+def _on_listener_lost():
+    # Revocations published while the listener is down never reach the
+    # filter; ask Redis until a resync after the reconnect.
+    global _synced
+    _synced = False
+
+
+cache.subscribe(settings.revocation_channel, _on_revoked)
+
+
+async def sync():
+    """Rebuild the filter from the set of unexpired revoked jtis in Redis."""
+    global _bloom, _synced, _pending
+    _pending = []
+    try:
+        jtis = await cache.zmembers(REVOKED_SET, min_score=time.time())
+        bloom = BloomFilter(
+            max(settings.revocation_bloom_capacity, 2 * len(jtis)),
+            settings.revocation_bloom_error_rate,
+        )
+        for jti in [*jtis, *_pending]:
+            bloom.add(jti)
+        _bloom = bloom
+    finally:
+        _pending = None
+    _synced = True
+
+
+cache.on_reconnect(_on_listener_lost, sync)
+
+
+async def _sync_periodically():
+    while True:
+        await asyncio.sleep(settings.revocation_sync_seconds)
+        try:
+            await sync()
+        except Exception:
+            logger.warning("Revocation list sync failed", exc_info=True)
+
+
+async def start():
+    global _sync_task
+    try:
+        await sync()
+    except Exception:
+        logger.warning("Initial revocation list sync failed", exc_info=True)
+    _sync_task = asyncio.create_task(_sync_periodically())
+
+
+async def stop():
+    global _sync_task, _synced
+    if _sync_task:
+        _sync_task.cancel()
+        _sync_task = None
+    _synced = False
+
+
+async def revoke(jti: str, expires_at: float):
+    """Revoke one token until it would have expired anyway."""
+    remaining = int(expires_at - time.time())
+    if remaining <= 0:
+        return
+    _on_revoked(jti)
+    await cache.set(f"revoked:{jti}", 1, expire=remaining)
+    await cache.zadd(REVOKED_SET, jti, expires_at)
+    await cache.publish(settings.revocation_channel, jti)
+
+
+async def is_revoked(jti: str) -> bool:
+    if _synced and jti not in _bloom:
+        token_revocation_checks.labels(result="skipped").inc()
+        return False
+
+    revoked = bool(await cache.get(f"revoked:{jti}"))
+    token_revocation_checks.labels(result="revoked" if revoked else "valid").inc()
+    return revoked
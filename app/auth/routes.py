@@ -1,17 +1,22 @@
-from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from app.core import cache
-from app.users.models import User
-from app.core.deps import oauth2_scheme
+from app.auth import revocation
+from app.core.deps import get_current_user, load_principal, oauth2_scheme
 from app.core.database import get_session
-from app.auth.security import decode_token
-from app.auth.schemas import Token, LoginRequest
+from app.core.responses import OrjsonResponse
+from app.auth.security import decode_token, forget_token
+from app.auth.schemas import Principal, Token, LoginRequest
 from app.users.schemas import UserCreate, UserResponse
-from app.auth.service import authenticate_user, create_user, issue_token
+from app.users.service import user_payload
+from app.auth.service import (
+    authenticate_user,
+    create_user,
+    issue_token,
+    revoke_all_sessions,
+    token_generation,
+)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -27,7 +32,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_session))
             status_code=status.HTTP_409_CONFLICT,
             detail="Email or Username already registered",
         )
-    return user
+    return OrjsonResponse(user_payload(user), status_code=status.HTTP_201_CREATED)
 
 
 @router.post("/login", response_model=Token)
@@ -39,7 +44,7 @@ async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_session
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return issue_token(user.id)
+    return issue_token(user.id, await token_generation(user.id), user.role)
 
 
 @router.post("/refresh", response_model=Token)
@@ -50,21 +55,34 @@ async def refresh_token(refresh_token: str, db: AsyncSession = Depends(get_sessi
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
         )
 
-    result = await db.execute(select(User).where(User.id == payload["sub"]))
-    user = result.scalar_one_or_none()
-    if not user or not user.is_active:
+    if payload.get("jti") and await revocation.is_revoked(payload["jti"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
+
+    principal = await load_principal(db, payload["sub"])
+    if not principal or not principal.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive",
         )
+    if payload.get("gen", 0) < principal.token_generation:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
 
-    return issue_token(user.id)
+    return issue_token(principal.id, principal.token_generation, principal.role)
 
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
 async def logout(token: str = Depends(oauth2_scheme)):
     payload = decode_token(token)
-    if payload:
-        remaining = int(payload.get("exp", 0)) - datetime.now(timezone.utc).timestamp()
-        if remaining > 0:
-            await cache.set(f"blocked:{token}", "1", expire=remaining)
+    if payload and payload.get("jti"):
+        await revocation.revoke(payload["jti"], payload.get("exp", 0))
+    forget_token(token)
+
+
+@router.post("/logout-all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all(current_user: Principal = Depends(get_current_user)):
+    """Revoke every access and refresh token issued to the current user."""
+    await revoke_all_sessions(current_user.id)
@@ -1,5 +1,9 @@
+from uuid import UUID
+
 from pydantic import BaseModel
 
+from app.users.models import UserRole
+
 
 class Token(BaseModel):
     access_token: str
@@ -10,3 +14,13 @@ class Token(BaseModel):
 class LoginRequest(BaseModel):
     username: str
     password: str
+
+
+class Principal(BaseModel):
+    """Authenticated caller — the subset of a user needed for authorization."""
+
+    id: UUID
+    role: UserRole
+    is_active: bool
+    version: int = 0
+    token_generation: int = 0
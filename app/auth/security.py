@@ -1,12 +1,43 @@
+import time
+import uuid
+import asyncio
+import hashlib
 import bcrypt
 import jwt
 
+from concurrent.futures import ThreadPoolExecutor
 from jwt.exceptions import InvalidTokenError
 from datetime import datetime, timedelta, timezone
+from app.core.cache import LocalCache
 from app.core.config import settings
+from app.metrics import (
+    cache_hits,
+    cache_misses,
+    password_hash_duration,
+    password_hash_queue_depth,
+    password_hash_rejected,
+)
 
 ALGORITHM = "HS256"
 
+# bcrypt releases the GIL, so a thread pool gives real parallelism.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt"
+)
+_in_flight = 0
+
+# Verified token payloads keyed by a digest of the token, each kept until the
+# token's own exp. A token is only cached after its signature checked out.
+_verified_tokens = LocalCache(
+    settings.token_cache_max_entries,
+    settings.access_token_expire_minutes * 60,
+    "tokens",
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
 
 def get_password_hash(password: str):
     return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
@@ -16,29 +47,128 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 
-def create_access_token(user_id: str) -> str:
+def _timed(operation: str, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        password_hash_duration.labels(operation=operation).observe(
+            time.perf_counter() - start
+        )
+
+
+async def _run_in_pool(operation: str, func, *args):
+    """Run bcrypt off the event loop; fail fast instead of queueing unboundedly."""
+    global _in_flight
+    if _in_flight >= settings.password_hash_workers + settings.password_hash_queue_size:
+        password_hash_rejected.inc()
+        raise PasswordHasherBusy()
+
+    _in_flight += 1
+    password_hash_queue_depth.set(_in_flight)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            _executor, _timed, operation, func, *args
+        )
+    finally:
+        _in_flight -= 1
+        password_hash_queue_depth.set(_in_flight)
+
+
+async def hash_password(password: str) -> str:
+    return await _run_in_pool("hash", get_password_hash, password)
+
+
+async def hash_passwords(passwords: list[str]) -> list[str]:
+    """Hash many passwords in waves of one job per worker.
+
+    Bulk work skips the fast-fail check but never holds more than one wave in
+    the pool, so interactive logins wait behind at most one wave.
+    """
+    global _in_flight
+    loop = asyncio.get_running_loop()
+    hashes = []
+    step = settings.password_hash_workers
+    for start in range(0, len(passwords), step):
+        wave = passwords[start : start + step]
+        _in_flight += len(wave)
+        password_hash_queue_depth.set(_in_flight)
+        try:
+            hashes += await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        _executor, _timed, "hash", get_password_hash, password
+                    )
+                    for password in wave
+                )
+            )
+        finally:
+            _in_flight -= len(wave)
+            password_hash_queue_depth.set(_in_flight)
+    return hashes
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_pool(
+        "verify", verify_password, plain_password, hashed_password
+    )
+
+
+def create_access_token(
+    user_id: str, generation: int = 0, role: str | None = None
+) -> str:
+    """``role`` is informational (load-shedding priority); authorization
+    always uses the current principal."""
     expire = datetime.now(timezone.utc) + timedelta(
         minutes=settings.access_token_expire_minutes
     )
-    encoded_jwt = jwt.encode(
-        {"exp": expire, "sub": user_id}, settings.secret_key, algorithm=ALGORITHM
-    )
+    claims = {"exp": expire, "sub": user_id, "jti": uuid.uuid4().hex, "gen": generation}
+    if role:
+        claims["role"] = role
+    encoded_jwt = jwt.encode(claims, settings.secret_key, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def create_refresh_token(user_id: str) -> str:
+def create_refresh_token(user_id: str, generation: int = 0) -> str:
     expire = datetime.now(timezone.utc) + timedelta(
         minutes=settings.access_token_expire_minutes
     )
     return jwt.encode(
-        {"exp": expire, "sub": user_id, "type": "refresh"},
+        {
+            "exp": expire,
+            "sub": user_id,
+            "type": "refresh",
+            "jti": uuid.uuid4().hex,
+            "gen": generation,
+        },
         settings.secret_key,
         algorithm=ALGORITHM,
     )
 
 
+def _token_key(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+
 def decode_token(token: str):
+    key = _token_key(token)
+    payload = _verified_tokens.get(key)
+    if payload is not None:
+        cache_hits.labels(operation="decode_token", tier="tokens").inc()
+        return payload
+    cache_misses.labels(operation="decode_token", tier="tokens").inc()
+
     try:
-        return jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
     except InvalidTokenError:
         return None
+
+    ttl = payload.get("exp", 0) - time.time()
+    if ttl > 0:
+        _verified_tokens.set(key, payload, ttl=ttl)
+    return payload
+
+
+def forget_token(token: str):
+    """Drop a token from the verified-token cache, e.g. after logout."""
+    _verified_tokens.pop(_token_key(token))
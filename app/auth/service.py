@@ -4,12 +4,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.auth.security import (
     create_access_token,
     create_refresh_token,
-    get_password_hash,
-    verify_password,
+    check_password,
+    hash_password,
 )
-from app.users.models import User
+from app.core import cache
+from app.users.models import User, UserRole
 from app.auth.schemas import Token
 from app.users.schemas import UserCreate
+from app.users.service import invalidate_user_cache
 
 
 async def authenticate_user(
@@ -19,7 +21,7 @@ async def authenticate_user(
     result = await session.execute(select(User).where(field == username))
     user = result.scalar_one_or_none()
 
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await check_password(password, user.hashed_password):
         return None
     return user
 
@@ -29,7 +31,7 @@ async def create_user(session: AsyncSession, user_in: UserCreate) -> User:
         email=user_in.email,
         username=user_in.username,
         full_name=user_in.full_name,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await hash_password(user_in.password),
         role=user_in.role,
     )
     session.add(user)
@@ -39,8 +41,23 @@ async def create_user(session: AsyncSession, user_in: UserCreate) -> User:
     return user
 
 
-def issue_token(user_id: str) -> Token:
-    access_token = create_access_token(str(user_id))
-    refresh_token = create_refresh_token(str(user_id))
+def issue_token(
+    user_id: str, generation: int = 0, role: UserRole | None = None
+) -> Token:
+    access_token = create_access_token(
+        str(user_id), generation, role.value if role else None
+    )
+    refresh_token = create_refresh_token(str(user_id), generation)
 
     return Token(access_token=access_token, refresh_token=refresh_token)
+
+
+async def token_generation(user_id) -> int:
+    """Tokens issued with an older generation than this are revoked."""
+    return await cache.get(f"token_gen:{user_id}") or 0
+
+
+async def revoke_all_sessions(user_id):
+    """Revoke every token issued so far for the user by bumping their generation."""
+    await cache.incr(f"token_gen:{user_id}")
+    await invalidate_user_cache(user_id)
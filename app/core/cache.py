@@ -1,40 +1,235 @@
-import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import logging
 
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
 from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
 
+from app.core import codecs
 from app.core.config import settings
+from app.core.memory_backend import MemoryBackend, register_script_handler
+from app.metrics import (
+    cache_coalesced_loads,
+    cache_early_refreshes,
+    cache_evictions,
+    cache_hits,
+    cache_misses,
+)
 
-_redis: Redis | None = None
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with a TTL on every entry."""
+
+    def __init__(self, max_entries: int, ttl: float, tier: str = "l1"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.tier = tier
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            cache_evictions.labels(tier=self.tier, reason="expired").inc()
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value, ttl: float | None = None):
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            cache_evictions.labels(tier=self.tier, reason="size").inc()
+
+    def pop(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+local = LocalCache(settings.local_cache_max_entries, settings.local_cache_ttl_seconds)
+
+# A Redis client, or the in-process MemoryBackend for ``memory://`` URLs.
+_redis: Redis | MemoryBackend | None = None
+_scripts: dict[str, AsyncScript] = {}
+_listener: asyncio.Task | None = None
+_inflight: dict[str, asyncio.Future] = {}
+
+# Delete a lock only if we still own it, so an expired lock re-taken by
+# another worker is never released by us.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _release_lock(store: MemoryBackend, keys: list, args: list) -> int:
+    if store.read(keys[0]) == args[0].encode():
+        return int(store.remove(keys[0]))
+    return 0
+
+
+register_script_handler(RELEASE_LOCK_SCRIPT, _release_lock)
+
+_handlers: dict[str, Callable[[str], None]] = {
+    settings.cache_invalidation_channel: local.pop,
+}
+
+
+def subscribe(channel: str, handler: Callable[[str], None]):
+    """Call ``handler`` with every message published on ``channel``.
+
+    Register before ``connect()``; the listener subscribes once at startup.
+    """
+    _handlers[channel] = handler
+
+
+# Hooks for a dropped listener: (called on the drop, awaited on resubscribe).
+_reconnect_hooks: list[tuple[Callable[[], None], Callable[[], Awaitable]]] = []
+
+
+def on_reconnect(lost: Callable[[], None], resubscribed: Callable[[], Awaitable]):
+    """Call ``lost()`` when the listener drops and messages may be missed,
+    and await ``resubscribed()`` once it is subscribed again."""
+    _reconnect_hooks.append((lost, resubscribed))
 
 
 async def connect():
-    global _redis
-    _redis = Redis.from_url(settings.redis_url, decode_responses=True)
+    global _redis, _listener
+    if settings.redis_url.startswith("memory://"):
+        _redis = MemoryBackend()
+    else:
+        _redis = Redis.from_url(settings.redis_url)
+    _listener = asyncio.create_task(_listen())
 
 
 async def disconnect():
-    global _redis
+    global _redis, _listener
+    if _listener:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
     if _redis:
         await _redis.aclose()
         _redis = None
+    _scripts.clear()
+    local.clear()
+
+
+async def _listen():
+    """Dispatch pub/sub messages, e.g. drop L1 entries other workers invalidated."""
+    dropped = False
+    while True:
+        try:
+            async with _redis.pubsub() as pubsub:
+                await pubsub.subscribe(*_handlers)
+                if dropped:
+                    dropped = False
+                    for _, resubscribed in _reconnect_hooks:
+                        try:
+                            await resubscribed()
+                        except Exception:
+                            logger.warning("Reconnect hook failed", exc_info=True)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _handlers[message["channel"].decode()](message["data"].decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Messages may have been missed while disconnected.
+            logger.warning("Cache pub/sub listener failed", exc_info=True)
+            local.clear()
+            if not dropped:
+                dropped = True
+                for lost, _ in _reconnect_hooks:
+                    lost()
+            await asyncio.sleep(1)
 
 
 async def client():
     return _redis
 
 
+def _decode(key: str, value: bytes | str | None):
+    """Decode a stored value; one this release can't read counts as a miss."""
+    # The client never decodes responses, so a stored value is always bytes.
+    if not isinstance(value, bytes) or not value:
+        return None
+    try:
+        return codecs.decode(value)
+    except ValueError:
+        logger.warning("Ignoring undecodable cache value for %s", key, exc_info=True)
+        return None
+
+
 async def get(key: str):
     if not _redis:
         return None
 
-    value = await _redis.get(key)
-    return json.loads(value) if value else None
+    return _decode(key, await _redis.get(key))
 
 
 async def set(key: str, value, expire: int = 300) -> bool:
     if not _redis:
         return False
-    return await _redis.setex(key, expire, json.dumps(value, default=str))
+    return bool(await _redis.set(key, codecs.encode(value), ex=expire))
+
+
+async def mget(keys: list[str]) -> list:
+    if not _redis:
+        return [None] * len(keys)
+
+    values = await _redis.mget(keys)
+    return [_decode(key, value) for key, value in zip(keys, values)]
+
+
+async def incr(key: str) -> int | None:
+    if not _redis:
+        return None
+    return await _redis.incr(key)
+
+
+async def publish(channel: str, message: str):
+    if not _redis:
+        return
+    await _redis.publish(channel, message)
+
+
+async def zadd(key: str, member: str, score: float):
+    if not _redis:
+        return
+    await _redis.zadd(key, {member: score})
+
+
+async def zmembers(key: str, min_score: float) -> list[str]:
+    """Return members scored at or above ``min_score``, pruning the rest."""
+    if not _redis:
+        return []
+    async with _redis.pipeline(transaction=False) as pipe:
+        pipe.zremrangebyscore(key, "-inf", f"({min_score}")
+        pipe.zrange(key, 0, -1)
+        _, members = await pipe.execute()
+    return [member.decode() for member in members]
 
 
 async def delete(key: str) -> bool:
@@ -42,3 +237,174 @@ async def delete(key: str) -> bool:
         return False
 
     return await _redis.delete(key) > 0
+
+
+async def run_script(script: str, keys: list[str], args: list):
+    """Run a Lua script server-side in one round trip (EVALSHA, EVAL on first use)."""
+    if not _redis:
+        return None
+
+    registered = _scripts.get(script)
+    if registered is None:
+        registered = _scripts[script] = _redis.register_script(script)
+    return await registered(keys=keys, args=args)
+
+
+async def acquire_lock(key: str, token: str, ttl_ms: int) -> bool:
+    if not _redis:
+        return True
+    return bool(await _redis.set(key, token, nx=True, px=ttl_ms))
+
+
+async def release_lock(key: str, token: str):
+    await run_script(RELEASE_LOCK_SCRIPT, [key], [token])
+
+
+def _entry(value) -> dict | None:
+    """The ``get_or_set`` envelope stored under a key, or None for anything
+    else (e.g. a plain value written by an older release)."""
+    if isinstance(value, dict) and value.keys() == {"v", "d", "x"}:
+        return value
+    return None
+
+
+def _should_refresh_early(entry: dict, beta: float) -> bool:
+    """XFetch: recompute ahead of expiry with a probability that grows as
+    expiry nears, weighted by how long the value took to compute."""
+    return time.time() - entry["d"] * beta * math.log(random.random()) >= entry["x"]
+
+
+async def get_or_set(
+    key: str,
+    loader: Callable[[], Awaitable],
+    ttl: int = 300,
+    operation: str = "get_or_set",
+    beta: float = 1.0,
+):
+    """Read through L1 and Redis, calling ``loader`` on a miss.
+
+    Past L1, concurrent callers in this worker share one flight per key (the
+    Redis read and any load), and a short Redis lock lets one worker
+    recompute while others wait for its result. Hot keys are recomputed
+    early (see ``_should_refresh_early``) so they rarely expire under load.
+    ``None`` results are not cached.
+    """
+    value = local.get(key)
+    if value is not None:
+        cache_hits.labels(operation=operation, tier="l1").inc()
+        return value
+    cache_misses.labels(operation=operation, tier="l1").inc()
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch(key, loader, ttl, operation, beta))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        cache_coalesced_loads.labels(operation=operation, scope="local").inc()
+    # Shielded so one cancelled caller doesn't fail the others sharing the load.
+    return await asyncio.shield(task)
+
+
+async def _fetch(key: str, loader, ttl: int, operation: str, beta: float):
+    entry = _entry(await get(key))
+    if entry is not None:
+        if not _should_refresh_early(entry, beta):
+            cache_hits.labels(operation=operation, tier="redis").inc()
+            local.set(key, entry["v"])
+            return entry["v"]
+        cache_early_refreshes.labels(operation=operation).inc()
+    else:
+        cache_misses.labels(operation=operation, tier="redis").inc()
+    return await _load(key, loader, ttl, operation, entry)
+
+
+async def _load(key: str, loader, ttl: int, operation: str, stale: dict | None):
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    if await acquire_lock(lock_key, token, settings.cache_lock_ttl_ms):
+        try:
+            return await _compute(key, loader, ttl)
+        finally:
+            await release_lock(lock_key, token)
+
+    cache_coalesced_loads.labels(operation=operation, scope="lock").inc()
+    if stale is not None:
+        # Another worker is already refreshing; keep serving the current value.
+        return stale["v"]
+    deadline = time.monotonic() + settings.cache_lock_ttl_ms / 1000
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+        entry = _entry(await get(key))
+        if entry is not None:
+            local.set(key, entry["v"])
+            return entry["v"]
+    # The lock holder died or is too slow; load for ourselves.
+    return await _compute(key, loader, ttl)
+
+
+async def _compute(key: str, loader, ttl: int):
+    start = time.perf_counter()
+    value = await loader()
+    if value is None:
+        return None
+    entry = {"v": value, "d": time.perf_counter() - start, "x": time.time() + ttl}
+    await set(key, entry, expire=ttl)
+    local.set(key, value)
+    return value
+
+
+async def get_many(keys: list[str], operation: str = "get_many") -> dict:
+    """Batch read of ``get_or_set`` entries: L1 first, then one MGET for the rest.
+
+    Returns only the keys that were found.
+    """
+    found = {}
+    remote = []
+    for key in keys:
+        value = local.get(key)
+        if value is not None:
+            found[key] = value
+        else:
+            remote.append(key)
+    cache_hits.labels(operation=operation, tier="l1").inc(len(found))
+    cache_misses.labels(operation=operation, tier="l1").inc(len(remote))
+    if not remote:
+        return found
+
+    entries = await mget(remote)
+    for key, entry in zip(remote, map(_entry, entries)):
+        if entry is not None:
+            found[key] = entry["v"]
+            local.set(key, entry["v"])
+    hits = len(found) - (len(keys) - len(remote))
+    cache_hits.labels(operation=operation, tier="redis").inc(hits)
+    cache_misses.labels(operation=operation, tier="redis").inc(len(remote) - hits)
+    return found
+
+
+async def set_many(values: dict, ttl: int = 300, compute_time: float = 0.0):
+    """Write ``get_or_set``-compatible entries for many keys in one pipeline."""
+    for key, value in values.items():
+        local.set(key, value)
+    if not _redis or not values:
+        return
+    expires_at = time.time() + ttl
+    async with _redis.pipeline(transaction=False) as pipe:
+        for key, value in values.items():
+            entry = {"v": value, "d": compute_time, "x": expires_at}
+            pipe.set(key, codecs.encode(entry), ex=ttl)
+        await pipe.execute()
+
+
+async def invalidate(*keys: str):
+    """Delete keys from Redis and from the in-process cache of every worker."""
+    for key in keys:
+        local.pop(key)
+    if not _redis:
+        return
+    async with _redis.pipeline(transaction=False) as pipe:
+        pipe.delete(*keys)
+        for key in keys:
+            pipe.publish(settings.cache_invalidation_channel, key)
+        await pipe.execute()
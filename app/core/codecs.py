@@ -0,0 +1,199 @@
+"""Serialization codecs for values stored in Redis by ``app.core.cache``.
+
+Every encoded value starts with a two-byte header: the codec id and a flags
+byte (bit 0 = zlib-compressed). Readers pick the codec from the header, so
+the configured codec can change without flushing Redis. Values written
+before headers existed are plain JSON text, which never starts with a
+control byte, and still decode.
+
+UUID, datetime and Enum values round-trip exactly with every codec. Only
+Enum classes registered with ``register_enum`` are encoded or decoded, so
+data in Redis can never name an arbitrary callable for the decoder to run.
+"""
+
+import json
+import uuid
+import zlib
+
+from datetime import datetime
+from enum import Enum
+from functools import lru_cache
+
+from app.core.config import settings
+
+COMPRESSED = 0x01
+
+
+# Enum classes allowed in cached values, by "module:qualname".
+_enums: dict[str, type[Enum]] = {}
+
+
+def register_enum(cls: type[Enum]) -> type[Enum]:
+    """Class decorator: allow ``cls`` members in cached values."""
+    _enums[f"{cls.__module__}:{cls.__qualname__}"] = cls
+    return cls
+
+
+def _enum_class(path: str) -> type[Enum]:
+    cls = _enums.get(path)
+    if cls is None:
+        raise ValueError(f"Enum {path!r} is not registered for caching")
+    return cls
+
+
+def _enum_path(value: Enum) -> str:
+    path = f"{type(value).__module__}:{type(value).__qualname__}"
+    if _enums.get(path) is not type(value):
+        raise TypeError(f"Enum {path} is not registered for caching")
+    return path
+
+
+def _tag(value):
+    """Rewrite types JSON can't represent into {"$t": ..., "v": ...} objects."""
+    if isinstance(value, Enum):
+        return {"$t": "enum", "c": _enum_path(value), "v": _tag(value.value)}
+    if isinstance(value, dict):
+        return {key: _tag(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_tag(item) for item in value]
+    if isinstance(value, uuid.UUID):
+        return {"$t": "uuid", "v": str(value)}
+    if isinstance(value, datetime):
+        return {"$t": "datetime", "v": value.isoformat()}
+    return value
+
+
+def _untag(value):
+    if isinstance(value, dict):
+        kind = value.get("$t")
+        if kind == "uuid":
+            return uuid.UUID(value["v"])
+        if kind == "datetime":
+            return datetime.fromisoformat(value["v"])
+        if kind == "enum":
+            return _enum_class(value["c"])(_untag(value["v"]))
+        return {key: _untag(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_untag(item) for item in value]
+    return value
+
+
+class JsonCodec:
+    id = 1
+
+    def dumps(self, value) -> bytes:
+        return json.dumps(_tag(value), separators=(",", ":")).encode()
+
+    def loads(self, data: bytes):
+        return _untag(json.loads(data))
+
+
+class OrjsonCodec:
+    id = 2
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def dumps(self, value) -> bytes:
+        return self._orjson.dumps(_tag(value))
+
+    def loads(self, data: bytes):
+        return _untag(self._orjson.loads(data))
+
+
+class MsgpackCodec:
+    """msgpack with ext types, so no tagging pass over the value is needed."""
+
+    id = 3
+
+    EXT_UUID = 1
+    EXT_DATETIME = 2
+    EXT_ENUM = 3
+
+    def __init__(self):
+        import msgpack  # type: ignore[import-untyped]
+
+        self._msgpack = msgpack
+        self._packer = msgpack.Packer(default=self._default, strict_types=True)
+
+    @lru_cache(maxsize=1024)
+    def _enum_ext(self, value: Enum):
+        payload = self._msgpack.packb([_enum_path(value), value.value])
+        return self._msgpack.ExtType(self.EXT_ENUM, payload)
+
+    def _default(self, value):
+        # strict_types routes str/int Enum subclasses and tuples here too.
+        if isinstance(value, Enum):
+            return self._enum_ext(value)
+        if isinstance(value, uuid.UUID):
+            return self._msgpack.ExtType(self.EXT_UUID, value.bytes)
+        if isinstance(value, datetime):
+            return self._msgpack.ExtType(self.EXT_DATETIME, value.isoformat().encode())
+        if isinstance(value, tuple):
+            return list(value)
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+    def _ext_hook(self, code: int, data: bytes):
+        if code == self.EXT_UUID:
+            return uuid.UUID(bytes=data)
+        if code == self.EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == self.EXT_ENUM:
+            path, value = self.loads(data)
+            return _enum_class(path)(value)
+        return self._msgpack.ExtType(code, data)
+
+    def dumps(self, value) -> bytes:
+        return self._packer.pack(value)
+
+    def loads(self, data: bytes):
+        return self._msgpack.unpackb(data, ext_hook=self._ext_hook)
+
+
+Codec = JsonCodec | OrjsonCodec | MsgpackCodec
+
+CODECS: dict[str, type[Codec]] = {
+    "json": JsonCodec,
+    "orjson": OrjsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+_by_id: dict[int, Codec] = {}
+
+
+def _codec_by_id(codec_id: int) -> Codec | None:
+    codec = _by_id.get(codec_id)
+    if codec is None:
+        for cls in CODECS.values():
+            if cls.id == codec_id:
+                codec = _by_id[codec_id] = cls()
+    return codec
+
+
+def get_codec(name: str) -> Codec | None:
+    return _codec_by_id(CODECS[name].id)
+
+
+def encode(value, codec=None) -> bytes:
+    codec = codec or get_codec(settings.cache_codec)
+    data = codec.dumps(value)
+    flags = 0
+    if len(data) >= settings.cache_compress_min_bytes:
+        data = zlib.compress(data, settings.cache_compress_level)
+        flags |= COMPRESSED
+    return bytes((codec.id, flags)) + data
+
+
+def decode(data: bytes):
+    if not data or data[0] >= 0x20:
+        return json.loads(data)
+
+    codec = _codec_by_id(data[0])
+    if codec is None:
+        raise ValueError(f"Unknown cache codec id {data[0]}")
+    payload = data[2:]
+    if data[1] & COMPRESSED:
+        payload = zlib.decompress(payload)
+    return codec.loads(payload)
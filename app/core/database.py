@@ -1,10 +1,307 @@
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import itertools
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from app.core import cache
 from app.core.config import settings
+from app.metrics import (
+    db_connection_lifetime,
+    db_pool_checked_out,
+    db_pool_checkout_wait,
+    db_pool_overflow,
+    db_query_duration,
+    db_read_sessions,
+)
+from app.middleware.correlation_id import current_request_id
+
+logger = logging.getLogger(__name__)
+# Pool loggers are named after the pool class, so ours falls outside the
+# "sqlalchemy" hierarchy that SQLAlchemy quiets to WARN; match it.
+logging.getLogger(f"{__name__}.InstrumentedQueuePool").setLevel(logging.WARNING)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that reports how long each checkout waited for a connection.
+
+    Pool events only fire once a connection has been handed out, so the
+    wait can't be measured from them; this overrides the (private) method
+    that blocks instead. test_pool_metrics notices if a SQLAlchemy release
+    renames it. The pool is labelled by its ``logging_name``, which survives
+    the ``recreate()`` done by ``engine.dispose()``.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.labels(pool=self.logging_name).observe(
+                time.perf_counter() - start
+            )
+
+
+def _instrument_pool(engine: AsyncEngine, name: str):
+    """Track checked-out and overflow connections, and record each
+    connection's lifetime from open to close."""
+    checked_out = db_pool_checked_out.labels(pool=name)
+    overflow = db_pool_overflow.labels(pool=name)
+
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info["connected_at"] = time.monotonic()
+
+    def on_close(dbapi_connection, connection_record):
+        connected_at = connection_record.info.pop("connected_at", None)
+        if connected_at is not None:
+            db_connection_lifetime.labels(pool=name).observe(
+                time.monotonic() - connected_at
+            )
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+        overflow.set(max(engine.sync_engine.pool.overflow(), 0))
+
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+        # Fires before the connection goes back: it is closed instead, and
+        # the overflow shrinks, when the idle queue is already full.
+        pool = engine.sync_engine.pool
+        full = pool.checkedin() >= pool.size()
+        overflow.set(max(pool.overflow() - full, 0))
+
+    event.listen(engine.sync_engine, "connect", on_connect)
+    event.listen(engine.sync_engine, "close", on_close)
+    event.listen(engine.sync_engine, "checkout", on_checkout)
+    event.listen(engine.sync_engine, "checkin", on_checkin)
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+
+
+# Statements run while handling the current request; set by MetricsMiddleware.
+request_queries: ContextVar[QueryStats | None] = ContextVar(
+    "request_queries", default=None
+)
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\$\d+|%\(\w+\)s|\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:::\w+)?(?:\s*,\s*\?(?:::\w+)?)*\s*\)"), "(?+)"),
+    # Multi-row VALUES (insertmanyvalues batches): with the parameters gone
+    # every row reads the same, so a run of identical groups becomes one.
+    (re.compile(r"(\((?:[^()]|\([^()]*\))*\))(?:\s*,\s*\1)+"), r"\1"),
+    (re.compile(r"\s+"), " "),
+]
+
+# Fingerprints already logged by this process.
+_seen_fingerprints: set[str] = set()
+
+
+@lru_cache(maxsize=1024)
+def _normalize(statement: str) -> tuple[str, str]:
+    normalized = statement.strip()
+    for pattern, replacement in _FINGERPRINT_RULES:
+        normalized = pattern.sub(replacement, normalized)
+    return hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest(), normalized
+
+
+def fingerprint(statement: str) -> str:
+    """Short stable id for a statement with its literals and parameters removed.
+
+    ``IN`` lists and multi-row ``VALUES`` collapse to one group, so a lookup
+    of 3 ids and one of 300, or an insert of 2 rows and one of 200, share a
+    fingerprint. Each fingerprint is logged once per process at DEBUG so an
+    id seen in metrics can be mapped back to its SQL.
+    """
+    digest, normalized = _normalize(statement)
+    if digest not in _seen_fingerprints:
+        _seen_fingerprints.add(digest)
+        logger.debug("SQL fingerprint %s: %s", digest, normalized)
+    return digest
+
+
+def _instrument_queries(engine: AsyncEngine, name: str):
+    """Time every statement, count it against the current request and log
+    the slow ones with the request's X-Request-ID."""
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._query_started
+        statement_id = fingerprint(statement)
+        db_query_duration.labels(pool=name, fingerprint=statement_id).observe(duration)
+        stats = request_queries.get()
+        if stats is not None:
+            stats.count += 1
+        if duration * 1000 >= settings.slow_query_ms:
+            logger.warning(
+                "Slow query %.1f ms on %s [fingerprint %s, request %s]: %s",
+                duration * 1000,
+                name,
+                statement_id,
+                current_request_id.get(),
+                statement,
+            )
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_execute)
+
+
+def create_engine(url: str, name: str) -> AsyncEngine:
+    """Create an engine with the configured, instrumented connection pool."""
+    created = create_async_engine(
+        url,
+        echo=False,
+        poolclass=InstrumentedQueuePool,
+        pool_logging_name=name,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={"statement_cache_size": settings.db_statement_cache_size},
+    )
+    _instrument_pool(created, name)
+    _instrument_queries(created, name)
+    return created
+
+
+class TrackedSession(AsyncSession):
+    """Session that pins its user's reads to the primary after a commit.
+
+    ``get_current_user`` stores the caller's id in ``session.info``; once that
+    caller commits, reads skip the replicas for ``replica_sticky_seconds`` so
+    they see their own writes despite replication lag.
+    """
+
+    async def commit(self):
+        await super().commit()
+        user_id = self.info.get("user_id")
+        if user_id and replicas:
+            await cache.set(f"rw:{user_id}", 1, expire=settings.replica_sticky_seconds)
+
+
+engine = create_engine(settings.database_url, "primary")
+async_session = async_sessionmaker(
+    engine, class_=TrackedSession, expire_on_commit=False
+)
+
+replicas = [
+    create_engine(url, f"replica-{index}")
+    for index, url in enumerate(settings.database_replica_urls)
+]
+_next_replica = itertools.count()
+# monotonic time until which a replica that failed to connect is skipped
+_replica_down_until: dict[int, float] = {}
+
+
+class ReplicaSession(AsyncSession):
+    """Session on a read replica that connects on first use, so requests the
+    cache answers never hold a replica connection.
+
+    If the replica can't be reached at that point it is skipped for
+    ``replica_retry_seconds`` and the session carries on against the primary.
+    """
+
+    _checked = False
+
+    async def _connect_or_fall_back(self):
+        index = self.info.get("replica")
+        if self._checked or index is None:
+            return
+        self._checked = True
+        try:
+            await super().connection()
+        except (OSError, SQLAlchemyError, asyncio.TimeoutError):
+            await self.rollback()
+            _replica_down_until[index] = (
+                time.monotonic() + settings.replica_retry_seconds
+            )
+            logger.warning("Replica %d unavailable, skipping it", index, exc_info=True)
+            del self.info["replica"]
+            self.bind = engine
+            self.sync_session.bind = engine.sync_engine
+            db_read_sessions.labels(pool="primary").inc()
+        else:
+            db_read_sessions.labels(pool=f"replica-{index}").inc()
+
+    async def connection(self, *args, **kwargs):
+        await self._connect_or_fall_back()
+        return await super().connection(*args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        await self._connect_or_fall_back()
+        return await super().execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        await self._connect_or_fall_back()
+        return await super().scalar(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        await self._connect_or_fall_back()
+        return await super().get(*args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        await self._connect_or_fall_back()
+        return await super().stream(*args, **kwargs)
+
+
+replica_sessions = [
+    async_sessionmaker(
+        replica,
+        class_=ReplicaSession,
+        expire_on_commit=False,
+        info={"replica": index},
+    )
+    for index, replica in enumerate(replicas)
+]
+
+
+def _replica_order() -> list[int]:
+    """Healthy replicas in round-robin order, starting one further each call."""
+    start = next(_next_replica)
+    now = time.monotonic()
+    order = [(start + offset) % len(replicas) for offset in range(len(replicas))]
+    return [index for index in order if _replica_down_until.get(index, 0) <= now]
+
+
+@asynccontextmanager
+async def replica_session():
+    """Session on the next healthy replica, or the primary if all are down."""
+    order = _replica_order()
+    if order:
+        async with replica_sessions[order[0]]() as session:
+            yield session
+        return
+
+    db_read_sessions.labels(pool="primary").inc()
+    async with async_session() as session:
+        yield session
+
 
-engine = create_async_engine(settings.database_url, echo=False)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+def session_like(db: AsyncSession) -> AsyncSession:
+    """A new session of the same kind, on the same database, as ``db``."""
+    return type(db)(db.bind, expire_on_commit=False, info=dict(db.info))
 
 
 class Base(DeclarativeBase):
@@ -3,17 +3,70 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 
-from app.core import cache
+from app.auth import revocation
+from app.core import cache, database
+from app.core.config import settings
 from app.core.database import get_session
+from app.auth.schemas import Principal
 from app.auth.security import decode_token
+from app.metrics import cache_hits, cache_misses, db_read_sessions
+from app.middleware.correlation_id import current_user_id
 from app.users.models import User, UserRole
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
+async def load_principal(db: AsyncSession, user_id: str) -> Principal | None:
+    """Resolve a principal from L1, then Redis, then Postgres.
+
+    The Redis record is only trusted while its version matches
+    ``user_version:{id}``, which every user change bumps, so a record written
+    by a reader that raced an update is never served. ``token_gen:{id}`` is
+    fetched in the same MGET, so checking "revoke all sessions" is free.
+    L1 entries live for at most ``principal_max_staleness_seconds``.
+    """
+    key = f"principal:{user_id}"
+    principal = cache.local.get(key)
+    if principal is not None:
+        cache_hits.labels(operation="get_principal", tier="l1").inc()
+        return principal
+    cache_misses.labels(operation="get_principal", tier="l1").inc()
+
+    cached, version, generation = await cache.mget(
+        [key, f"user_version:{user_id}", f"token_gen:{user_id}"]
+    )
+    version = version or 0
+    if cached and cached["version"] == version:
+        cache_hits.labels(operation="get_principal", tier="redis").inc()
+        principal = Principal(**cached)
+    else:
+        cache_misses.labels(operation="get_principal", tier="redis").inc()
+        result = await db.execute(
+            select(User.id, User.role, User.is_active).where(User.id == user_id)
+        )
+        row = result.one_or_none()
+        if row is None:
+            return None
+        principal = Principal(
+            id=row.id,
+            role=row.role,
+            is_active=row.is_active,
+            version=version,
+            token_generation=generation or 0,
+        )
+        await cache.set(
+            key,
+            principal.model_dump(),
+            expire=settings.principal_cache_ttl_seconds,
+        )
+
+    cache.local.set(key, principal, ttl=settings.principal_max_staleness_seconds)
+    return principal
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_session)
-) -> User:
+) -> Principal:
     payload = decode_token(token)
     if payload is None:
         raise HTTPException(
@@ -21,27 +74,56 @@ async def get_current_user(
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    if await cache.get(f"blocked:{token}"):
+    if payload.get("jti") and await revocation.is_revoked(payload["jti"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked"
         )
 
-    result = await db.execute(select(User).where(User.id == payload.get("sub")))
-    user = result.scalar_one_or_none()
-    if user is None:
+    principal = await load_principal(db, payload.get("sub"))
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
         )
-    if not user.is_active:
+    if payload.get("gen", 0) < principal.token_generation:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked"
+        )
+    if not principal.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user"
         )
 
-    return user
+    db.info["user_id"] = str(principal.id)
+    current_user_id.set(str(principal.id))
+    return principal
+
+
+async def get_read_session(
+    principal: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_session),
+):
+    """Session for read-only routes: a replica when configured, unless the
+    caller committed a write within ``replica_sticky_seconds``. Such sessions
+    are flagged ``read_your_writes`` so reads also bypass the shared cache.
+
+    Authentication stays on the primary session, so a deactivation or role
+    change is never hidden by replication lag.
+    """
+    if not database.replicas:
+        yield db
+    elif await cache.get(f"rw:{principal.id}"):
+        db_read_sessions.labels(pool="primary").inc()
+        db.info["read_your_writes"] = True
+        yield db
+    else:
+        async with database.replica_session() as session:
+            yield session
 
 
 def require_role(required_role: UserRole):
-    async def role_checker(current_user: User = Depends(get_current_user)) -> User:
+    async def role_checker(
+        current_user: Principal = Depends(get_current_user),
+    ) -> Principal:
         if current_user.role != required_role:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
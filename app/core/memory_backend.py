@@ -0,0 +1,239 @@
+"""In-process stand-in for the Redis client used by ``app.core.cache``.
+
+Selected with ``REDIS_URL=memory://``. Implements the subset of
+``redis.asyncio.Redis`` the app calls: strings with TTLs, INCR, MGET, sorted
+sets, pub/sub fan-out within the process, pipelines, and the Lua scripts
+that have a Python twin registered with ``register_script_handler``. Values
+are stored as bytes, exactly as Redis would return them, so callers can't
+tell the difference. A single node then needs no Redis and no network hop;
+several workers each get their own, unshared store.
+
+Expiry uses a min-heap of deadlines: every call first pops the deadlines
+that have passed, so expired keys are dropped without ever scanning.
+"""
+
+import time
+import heapq
+import asyncio
+
+from collections.abc import Callable
+
+ScriptHandler = Callable[["MemoryBackend", list, list], object]
+
+_script_handlers: dict[str, ScriptHandler] = {}
+
+
+def register_script_handler(script: str, handler: ScriptHandler):
+    """Provide the Python equivalent of a Lua script for the memory backend.
+
+    ``handler(store, keys, args)`` runs without yielding to the event loop,
+    so it is atomic just like the script is in Redis.
+    """
+    _script_handlers[script] = handler
+
+
+def _bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+def _in_range(score: float, low, high) -> bool:
+    """ZRANGEBYSCORE-style bounds: numbers, "-inf"/"+inf", "(x" for exclusive."""
+
+    def parse(bound):
+        bound = bound.decode() if isinstance(bound, bytes) else str(bound)
+        if bound.startswith("("):
+            return float(bound[1:]), True
+        return float(bound), False
+
+    (low, low_open), (high, high_open) = parse(low), parse(high)
+    above = score > low if low_open else score >= low
+    below = score < high if high_open else score <= high
+    return above and below
+
+
+class MemoryBackend:
+    # Rebuild the deadline heap once it holds this many more entries than
+    # there are keys with a TTL (each re-set of a key leaves one stale entry).
+    COMPACT_SLACK = 1024
+
+    def __init__(self):
+        self._strings: dict[str, bytes] = {}
+        self._zsets: dict[str, dict[bytes, float]] = {}
+        self._expires: dict[str, float] = {}
+        self._deadlines: list[tuple[float, str]] = []
+        self._subscribers: dict[str, list[asyncio.Queue]] = {}
+
+    # Synchronous primitives, also used by script handlers.
+
+    def _purge(self):
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, key = heapq.heappop(self._deadlines)
+            if self._expires.get(key) == deadline:
+                self.remove(key)
+
+    def read(self, key: str) -> bytes | None:
+        self._purge()
+        return self._strings.get(key)
+
+    def write(self, key: str, value, ttl_ms: int | None = None):
+        """SET ``key``; without ``ttl_ms`` the key never expires."""
+        self._strings[key] = _bytes(value)
+        if ttl_ms is None:
+            self._expires.pop(key, None)
+            return
+        deadline = time.monotonic() + ttl_ms / 1000
+        self._expires[key] = deadline
+        heapq.heappush(self._deadlines, (deadline, key))
+        if len(self._deadlines) > 2 * len(self._expires) + self.COMPACT_SLACK:
+            self._deadlines = [(at, key) for key, at in self._expires.items()]
+            heapq.heapify(self._deadlines)
+
+    def remove(self, key: str) -> bool:
+        self._expires.pop(key, None)
+        removed_string = self._strings.pop(key, None) is not None
+        removed_zset = self._zsets.pop(key, None) is not None
+        return removed_string or removed_zset
+
+    # The redis.asyncio.Redis subset used by app.core.cache.
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get(self, key: str) -> bytes | None:
+        return self.read(key)
+
+    async def set(self, key: str, value, ex=None, px=None, nx: bool = False):
+        if nx and self.read(key) is not None:
+            return None
+        ttl_ms = px if px is not None else ex * 1000 if ex is not None else None
+        self.write(key, value, ttl_ms)
+        return True
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        self._purge()
+        return [self._strings.get(key) for key in keys]
+
+    async def incr(self, key: str) -> int:
+        value = int(self.read(key) or 0) + 1
+        # Like INCR, keeps any TTL the key already has.
+        self._strings[key] = _bytes(value)
+        return value
+
+    async def delete(self, *keys: str) -> int:
+        self._purge()
+        return sum(self.remove(key) for key in keys)
+
+    async def zadd(self, key: str, mapping: dict) -> int:
+        zset = self._zsets.setdefault(key, {})
+        members = {_bytes(member): float(score) for member, score in mapping.items()}
+        added = sum(member not in zset for member in members)
+        zset.update(members)
+        return added
+
+    async def zremrangebyscore(self, key: str, low, high) -> int:
+        zset = self._zsets.get(key, {})
+        doomed = [
+            member for member, score in zset.items() if _in_range(score, low, high)
+        ]
+        for member in doomed:
+            del zset[member]
+        return len(doomed)
+
+    async def zrange(self, key: str, start: int, end: int) -> list[bytes]:
+        ordered = sorted(
+            self._zsets.get(key, {}).items(), key=lambda item: (item[1], item[0])
+        )
+        stop = len(ordered) + end + 1 if end < 0 else end + 1
+        return [member for member, _ in ordered[start:stop]]
+
+    async def publish(self, channel: str, message) -> int:
+        queues = self._subscribers.get(channel, [])
+        for queue in queues:
+            queue.put_nowait(
+                {"type": "message", "channel": _bytes(channel), "data": _bytes(message)}
+            )
+        return len(queues)
+
+    def pubsub(self) -> "_PubSub":
+        return _PubSub(self)
+
+    def pipeline(self, transaction: bool = False) -> "_Pipeline":
+        return _Pipeline(self)
+
+    def register_script(self, script: str):
+        handler = _script_handlers.get(script)
+        if handler is None:
+            raise NotImplementedError(
+                "No in-process implementation registered for this Lua script"
+            )
+
+        async def run(keys=(), args=(), client=None):
+            return handler(self, list(keys), list(args))
+
+        return run
+
+    async def flushdb(self) -> bool:
+        self._strings.clear()
+        self._zsets.clear()
+        self._expires.clear()
+        self._deadlines.clear()
+        return True
+
+    async def aclose(self):
+        pass
+
+
+class _PubSub:
+    def __init__(self, backend: MemoryBackend):
+        self._backend = backend
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._channels: list[str] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for channel in self._channels:
+            self._backend._subscribers[channel].remove(self._queue)
+        self._channels.clear()
+
+    async def subscribe(self, *channels: str):
+        for channel in channels:
+            self._backend._subscribers.setdefault(channel, []).append(self._queue)
+            self._channels.append(channel)
+
+    async def listen(self):
+        while True:
+            yield await self._queue.get()
+
+
+class _Pipeline:
+    """Queues commands and runs them in order on ``execute()``."""
+
+    def __init__(self, backend: MemoryBackend):
+        self._backend = backend
+        self._commands: list = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._commands.clear()
+
+    def __getattr__(self, name: str):
+        command = getattr(self._backend, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [await command(*args, **kwargs) for command, args, kwargs in commands]
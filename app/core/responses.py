@@ -0,0 +1,38 @@
+import uuid
+import orjson
+
+from starlette.responses import Response
+
+
+def _default(value):
+    # asyncpg returns its own uuid.UUID subclass, which orjson doesn't accept.
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class OrjsonResponse(Response):
+    """JSON response rendered by orjson straight from plain dicts and lists.
+
+    Returning it from an endpoint bypasses FastAPI's response-model
+    validation, so the content must already have the response schema's
+    shape (see ``app.users.service.user_payload``). UUIDs, datetimes and
+    enums serialize natively; UTC datetimes end in ``Z`` like pydantic's.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an ``If-None-Match`` header against ``etag``."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(",")
+    )
@@ -0,0 +1,173 @@
+"""Worker startup: schema check, connection warm-up and cache preload.
+
+Instead of running ``create_all`` (a round of catalog queries) on every
+boot, workers compare a fingerprint of the models' DDL with the one stored
+in ``schema_fingerprint`` -- a single-row read when nothing changed. Only
+on a mismatch does one worker, holding a Postgres advisory lock, run
+``create_all``; the others wait on the lock and move on. ``create_all`` only
+adds missing tables (with their indexes), so the new fingerprint is stored
+only when it created the whole schema. On a database that already had the
+tables, new columns and indexes need a migration; until one is applied and
+recorded (by starting once with ``DB_SCHEMA_MODE=create``) the mismatch is
+logged as an error on every start.
+"""
+
+import time
+import asyncio
+import hashlib
+import logging
+
+from contextlib import AsyncExitStack, contextmanager
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, MetaData, String, Table, delete, insert
+from sqlalchemy import Connection, inspect, select, text
+from sqlalchemy import Enum as SQLEnum
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.core import cache, database
+from app.core.config import settings
+from app.core.database import Base
+from app.metrics import startup_duration
+from app.users.service import preload_recent_users
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_xact_lock, shared by every worker.
+SCHEMA_LOCK_ID = 7_310_024
+
+schema_state = Table(
+    "schema_fingerprint",
+    MetaData(),
+    Column("fingerprint", String(64), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+@contextmanager
+def phase(name: str):
+    """Record how long a startup phase takes in ``app_startup_seconds``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_duration.labels(phase=name).set(time.perf_counter() - start)
+
+
+def schema_fingerprint(dialect) -> str:
+    """Hash of the CREATE TABLE / CREATE INDEX DDL and enum values of all models."""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: str(index.name)):
+            parts.append(str(CreateIndex(index).compile(dialect=dialect)))
+        for column in table.columns:
+            if isinstance(column.type, SQLEnum):
+                parts.append(f"{table.name}.{column.name}: {column.type.enums}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def _existing_tables(conn: Connection) -> list[str]:
+    inspector = inspect(conn)
+    return [
+        table.name
+        for table in Base.metadata.sorted_tables
+        if inspector.has_table(table.name)
+    ]
+
+
+async def _stored_fingerprint(conn: AsyncConnection) -> str | None:
+    return await conn.scalar(select(schema_state.c.fingerprint))
+
+
+async def ensure_schema(engine: AsyncEngine):
+    """Apply DB_SCHEMA_MODE: ``auto`` creates the schema only when the stored
+    fingerprint differs, ``check`` refuses to start on a mismatch, and
+    ``create`` always runs ``create_all`` and records the fingerprint (use
+    it once after a migration)."""
+    mode = settings.db_schema_mode
+    expected = schema_fingerprint(engine.dialect)
+    if mode != "create":
+        try:
+            async with engine.connect() as conn:
+                stored = await _stored_fingerprint(conn)
+        except DBAPIError:
+            stored = None  # schema_fingerprint doesn't exist yet
+        if stored == expected:
+            return
+        if mode == "check":
+            raise RuntimeError(
+                f"Database schema fingerprint {stored} does not match the models"
+                f" ({expected}); migrate it or start with DB_SCHEMA_MODE=auto"
+            )
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID}
+        )
+        await conn.run_sync(schema_state.metadata.create_all)
+        stored = await _stored_fingerprint(conn)
+        if mode != "create" and stored == expected:
+            return  # another worker got there first
+        existing = await conn.run_sync(_existing_tables)
+        await conn.run_sync(Base.metadata.create_all)
+        if mode != "create" and existing:
+            logger.error(
+                "Database schema fingerprint %s does not match the models (%s)."
+                " Missing tables were created, but new columns and indexes on"
+                " existing tables (%s) need a migration; apply it, then start"
+                " once with DB_SCHEMA_MODE=create to record the fingerprint",
+                stored,
+                expected,
+                ", ".join(existing),
+            )
+            return
+        await conn.execute(delete(schema_state))
+        await conn.execute(
+            insert(schema_state).values(
+                fingerprint=expected, applied_at=datetime.now(timezone.utc)
+            )
+        )
+    logger.info("Database schema created, fingerprint %s", expected)
+
+
+async def _open_connections(engine: AsyncEngine, count: int):
+    """Check out ``count`` connections at once so the pool keeps them open."""
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(count))
+        )
+
+
+async def warm_up():
+    """Open WARMUP_DB_CONNECTIONS per engine and WARMUP_REDIS_CONNECTIONS to
+    Redis, so the first requests don't pay for connection setup."""
+    db_connections = min(
+        settings.warmup_db_connections,
+        settings.db_pool_size + settings.db_max_overflow,
+    )
+    tasks = [
+        _open_connections(engine, db_connections)
+        for engine in [database.engine, *database.replicas]
+    ]
+    redis = await cache.client()
+    if redis:
+        tasks += [redis.ping() for _ in range(settings.warmup_redis_connections)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Connection warm-up failed", exc_info=result)
+
+
+async def preload_hot_keys():
+    """Cache the PRELOAD_RECENT_USERS most recently updated users."""
+    if settings.preload_recent_users <= 0:
+        return
+    try:
+        async with database.async_session() as db:
+            loaded = await preload_recent_users(db, settings.preload_recent_users)
+    except Exception:
+        logger.warning("Cache preload failed", exc_info=True)
+        return
+    logger.info("Preloaded %d users into the cache", loaded)
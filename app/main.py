@@ -5,34 +5,46 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from prometheus_client import make_asgi_app
 from sqlalchemy.exc import IntegrityError
 
+from app.auth import revocation
 from app.core import cache
 from app.core.config import settings
-from app.core.database import Base, engine
+from app.core.database import engine
+from app.core.logs import configure_logging
+from app.core.startup import ensure_schema, phase, preload_hot_keys, warm_up
 from app.users.models import User
+from app.auth.security import PasswordHasherBusy
 from app.users.routes import router as user_router
 from app.auth.routes import router as auth_router
-from app.metrics import http_duration, http_requests
+from app.metrics import mark_worker_dead, metrics_app, startup_duration
+from app.middleware.concurrency import ConcurrencyLimitMiddleware
+from app.middleware.metrics import MetricsMiddleware
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.middleware.correlation_id import CorrelationIdMiddleware
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    await cache.connect()
+    started = time.perf_counter()
+    with phase("schema"):
+        await ensure_schema(engine)
+    with phase("connect"):
+        await cache.connect()
+        await revocation.start()
+    with phase("warm_up"):
+        await warm_up()
+    with phase("preload"):
+        await preload_hot_keys()
+    startup_duration.labels(phase="total").set(time.perf_counter() - started)
     yield
+    await revocation.stop()
     await cache.disconnect()
     await engine.dispose()
+    mark_worker_dead()
 
 
 app = FastAPI(
@@ -41,8 +53,12 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-app.add_middleware(CorrelationIdMiddleware)
+# Listed innermost first: requests pass CorrelationId, Metrics, CORS,
+# ConcurrencyLimit, then RateLimit, so throttled and shed responses still
+# carry an id and are counted, and shedding costs no Redis round trip.
 app.add_middleware(RateLimitMiddleware)
+if settings.concurrency_limit_enabled:
+    app.add_middleware(ConcurrencyLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
@@ -50,19 +66,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-
-@app.middleware("http")
-async def record_metric(request: Request, call_next):
-    """Record HTTP request count and duration for Prometheus."""
-    start = time.perf_counter()
-    response = await call_next(request)
-    duration = time.perf_counter() - start
-    http_requests.labels(
-        method=request.method, path=request.url.path, status=response.status_code
-    ).inc()
-    http_duration.observe(duration)
-    return response
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(CorrelationIdMiddleware)
 
 
 @app.exception_handler(IntegrityError)
@@ -71,10 +76,20 @@ async def integrity_error_handler(request: Request, exc: IntegrityError):
     return JSONResponse(status_code=409, content={"detail": "Resource already exists"})
 
 
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    """Shed logins/registrations when the bcrypt pool is saturated — returns 503."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(auth_router)
 app.include_router(user_router)
 
-app.mount("/metrics", make_asgi_app())
+app.mount("/metrics", metrics_app())
 
 
 @app.get("/health")
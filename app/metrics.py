@@ -1,4 +1,21 @@
-from prometheus_client import Counter, Histogram
+import os
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    make_asgi_app,
+    multiprocess,
+)
+
+from app.core.config import settings
+
+# With several workers, PROMETHEUS_MULTIPROC_DIR must be set (to an empty,
+# writable directory) before the server starts. Every worker then writes its
+# samples there and /metrics aggregates the files. Gauges state how workers'
+# values combine; "livesum" drops workers that have exited.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
 
 http_requests = Counter(
     "http_requests_total", "Total HTTP requests", ["method", "path", "status"]
@@ -6,10 +23,136 @@ http_requests = Counter(
 http_duration = Histogram(
     "http_request_duration_seconds",
     "HTTP request duration in seconds",
-    buckets=[0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0],
+    ["method", "path"],
+    buckets=settings.http_duration_buckets,
+)
+cache_hits = Counter("cache_hits_total", "Cache hits", ["operation", "tier"])
+cache_misses = Counter("cache_misses_total", "Cache misses", ["operation", "tier"])
+cache_coalesced_loads = Counter(
+    "cache_coalesced_loads_total",
+    "Cache misses served by another caller's load (local single-flight or Redis lock)",
+    ["operation", "scope"],
+)
+cache_early_refreshes = Counter(
+    "cache_early_refreshes_total",
+    "Cache entries recomputed before expiry",
+    ["operation"],
+)
+cache_evictions = Counter(
+    "cache_evictions_total", "In-process cache evictions", ["tier", "reason"]
 )
-cache_hits = Counter("cache_hits_total", "Cache hits", ["operation"])
-cache_misses = Counter("cache_misses_total", "Cache misses", ["operation"])
 rate_limit_decisions = Counter(
     "rate_limit_decisions_total", "Rate limiter decisions", ["decisions"]
 )
+password_hash_queue_depth = Gauge(
+    "password_hash_queue_depth",
+    "bcrypt operations running or waiting for a worker",
+    multiprocess_mode="livesum",
+)
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt hash/verify time on a worker thread",
+    ["operation"],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.5],
+)
+password_hash_rejected = Counter(
+    "password_hash_rejected_total", "bcrypt operations rejected with a full queue"
+)
+token_revocation_checks = Counter(
+    "token_revocation_checks_total",
+    "Token revocation checks; 'skipped' means the Bloom filter ruled it out locally",
+    ["result"],
+)
+db_pool_checked_out = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+db_pool_overflow = Gauge(
+    "db_pool_overflow_connections",
+    "Connections open beyond pool_size",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+db_pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for (or opening) a pooled connection",
+    ["pool"],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0],
+)
+db_connection_lifetime = Histogram(
+    "db_connection_lifetime_seconds",
+    "Age of database connections when they are closed",
+    ["pool"],
+    buckets=[1, 10, 60, 300, 900, 1800, 3600],
+)
+db_read_sessions = Counter(
+    "db_read_sessions_total",
+    "Read-only sessions opened, by the pool that served them",
+    ["pool"],
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time, by pool and statement fingerprint",
+    ["pool", "fingerprint"],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0],
+)
+db_queries_per_request = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed while handling one HTTP request",
+    ["method", "path"],
+    buckets=[0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64],
+)
+log_records_dropped = Counter(
+    "log_records_dropped_total",
+    "Log records discarded because the logging queue was full",
+)
+concurrency_limit = Gauge(
+    "concurrency_limit",
+    "Current adaptive limit on requests handled at once",
+    multiprocess_mode="livesum",
+)
+concurrency_inflight = Gauge(
+    "concurrency_inflight_requests",
+    "Requests currently admitted by the concurrency limiter",
+    multiprocess_mode="livesum",
+)
+concurrency_queue_wait = Histogram(
+    "concurrency_queue_wait_seconds",
+    "Time requests waited for a concurrency slot (including shed ones)",
+    buckets=[0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0],
+)
+requests_shed = Counter(
+    "requests_shed_total",
+    "Requests rejected with 503 because no concurrency (or bulk) slot was free",
+    ["priority"],
+)
+startup_duration = Gauge(
+    "app_startup_seconds",
+    "Time this worker spent in each startup phase, and in total",
+    ["phase"],
+    multiprocess_mode="liveall",
+)
+first_request_duration = Gauge(
+    "http_first_request_duration_seconds",
+    "Duration of the first request this worker served for each route",
+    ["method", "path"],
+    multiprocess_mode="liveall",
+)
+
+
+def metrics_app():
+    """ASGI app serving /metrics for this worker, or for all of them in
+    multiprocess mode."""
+    if not MULTIPROCESS:
+        return make_asgi_app()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return make_asgi_app(registry)
+
+
+def mark_worker_dead(pid: int | None = None):
+    """Drop an exited worker's live gauges from the multiprocess directory."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
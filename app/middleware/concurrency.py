@@ -0,0 +1,214 @@
+"""Adaptive concurrency limit and load shedding in front of the routers.
+
+Each worker admits at most ``limit`` requests at a time. Requests over the
+limit wait up to ``CONCURRENCY_MAX_WAIT_MS`` for a slot and are then shed
+with a 503 and ``Retry-After``, instead of piling up on the connection pool
+until everything times out together.
+
+The limit follows latency, in the style of Netflix's Gradient2: a short
+and a long moving average of request latency are kept, and while the short
+one stays within ``CONCURRENCY_TOLERANCE`` times the long one the limit
+grows by about sqrt(limit) per round; once latency climbs beyond it the
+limit shrinks in proportion. Latency is taken up to the response start,
+so a slowly consumed body doesn't count as a slow server.
+
+Paths in ``rate_limit.EXCLUDED`` are never limited. The bulk routes in
+``BULK`` run for seconds by design and would both hold a slot and drag the
+limit down for everyone else, so they are kept out of the latency samples
+and get their own fixed ``CONCURRENCY_BULK_LIMIT`` instead; over it they
+are shed at once. Admins
+(from the ``role`` claim of their access token) jump the queue and get
+``CONCURRENCY_ADMIN_RESERVE`` slots above the limit.
+"""
+
+import math
+import time
+import heapq
+import asyncio
+import itertools
+
+from fastapi import status
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import cache
+from app.core.config import settings
+from app.auth.security import decode_token
+from app.metrics import (
+    concurrency_inflight,
+    concurrency_limit,
+    concurrency_queue_wait,
+    requests_shed,
+)
+from app.middleware.rate_limit import EXCLUDED
+from app.users.models import UserRole
+
+ADMIN, USER = 0, 1
+
+# Long-running bulk routes, limited separately and never sampled.
+BULK = {"/users/export", "/users/import"}
+
+
+class GradientLimit:
+    # Weight of each new latency sample in the short and long averages.
+    SHORT_ALPHA = 0.1
+    LONG_ALPHA = 0.005
+    SMOOTHING = 0.2
+
+    def __init__(self, initial: int, minimum: int, maximum: int, tolerance: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.short_rtt = 0.0
+        self.long_rtt = 0.0
+
+    def update(self, rtt: float, inflight: int):
+        """Feed one request's latency, with the number in flight when it ran."""
+        if not self.long_rtt:
+            self.short_rtt = self.long_rtt = rtt
+            return
+        self.short_rtt += (rtt - self.short_rtt) * self.SHORT_ALPHA
+        self.long_rtt += (self.short_rtt - self.long_rtt) * self.LONG_ALPHA
+        # After a long overload the baseline is inflated; pull it back down
+        # quickly once latency recovers.
+        if self.long_rtt > 2 * self.short_rtt:
+            self.long_rtt *= 0.95
+
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        # Don't grow a limit that traffic isn't using.
+        if gradient == 1.0 and inflight < self.limit / 2:
+            return
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.SMOOTHING) + target * self.SMOOTHING
+        self.limit = max(self.minimum, min(self.maximum, limit))
+
+
+def _priority(scope: Scope) -> int:
+    scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return USER
+    payload = decode_token(token) or {}
+    if payload.get("role") == UserRole.ADMIN.value:
+        return ADMIN
+    # Tokens issued before the role claim existed: use the cached principal.
+    principal = cache.local.get(f"principal:{payload.get('sub')}")
+    return ADMIN if principal and principal.role == UserRole.ADMIN else USER
+
+
+class ConcurrencyLimitMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.limiter = GradientLimit(
+            settings.concurrency_initial_limit,
+            settings.concurrency_min_limit,
+            settings.concurrency_max_limit,
+            settings.concurrency_tolerance,
+        )
+        self.inflight = 0
+        self.bulk_inflight = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        concurrency_limit.set(self.limiter.limit)
+
+    def _capacity(self, priority: int) -> int:
+        reserve = settings.concurrency_admin_reserve if priority == ADMIN else 0
+        return int(self.limiter.limit) + reserve
+
+    def _has_slot(self, priority: int) -> bool:
+        return self.inflight < self._capacity(priority)
+
+    async def _acquire(self, priority: int) -> bool:
+        """Take a slot, waiting behind higher-priority requests; False to shed."""
+        if self._has_slot(priority) and not any(
+            not future.done() and waiting <= priority
+            for waiting, _, future in self._waiters
+        ):
+            self.inflight += 1
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await asyncio.wait(
+                {future}, timeout=settings.concurrency_max_wait_ms / 1000
+            )
+        except asyncio.CancelledError:
+            # Client gone: give back a slot that was handed over meanwhile.
+            if future.done() and not future.cancelled():
+                self._release()
+            future.cancel()
+            raise
+        # A slot handed over in the meantime is ours; otherwise withdraw.
+        future.cancel()
+        return not future.cancelled()
+
+    def _release(self):
+        self.inflight -= 1
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._has_slot(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.inflight += 1
+            future.set_result(True)
+
+    async def _shed(self, label: str, scope: Scope, receive: Receive, send: Send):
+        requests_shed.labels(priority=label).inc()
+        response = JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Server is overloaded, retry later"},
+            headers={"Retry-After": str(settings.concurrency_retry_after_seconds)},
+        )
+        await response(scope, receive, send)
+
+    async def _call_bulk(self, scope: Scope, receive: Receive, send: Send):
+        if self.bulk_inflight >= settings.concurrency_bulk_limit:
+            await self._shed("bulk", scope, receive, send)
+            return
+        self.bulk_inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.bulk_inflight -= 1
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in EXCLUDED:
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] in BULK:
+            await self._call_bulk(scope, receive, send)
+            return
+
+        priority = _priority(scope)
+        queued = time.perf_counter()
+        admitted = await self._acquire(priority)
+        concurrency_queue_wait.observe(time.perf_counter() - queued)
+        if not admitted:
+            await self._shed(
+                "admin" if priority == ADMIN else "user", scope, receive, send
+            )
+            return
+
+        inflight = self.inflight
+        concurrency_inflight.set(inflight)
+        start = time.perf_counter()
+        responded_at = None
+
+        async def send_and_time(message: Message):
+            nonlocal responded_at
+            if message["type"] == "http.response.start":
+                responded_at = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_time)
+        finally:
+            self.limiter.update((responded_at or time.perf_counter()) - start, inflight)
+            concurrency_limit.set(self.limiter.limit)
+            self._release()
+            concurrency_inflight.set(self.inflight)
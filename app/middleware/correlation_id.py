@@ -1,12 +1,43 @@
 import uuid
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request
+from contextvars import ContextVar
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+# X-Request-ID of the request being handled, for logs and outgoing calls.
+current_request_id: ContextVar[str | None] = ContextVar(
+    "current_request_id", default=None
+)
+# ASGI scope of that request; the router adds the matched "route" to it.
+current_scope: ContextVar[Scope | None] = ContextVar("current_scope", default=None)
+# Authenticated caller, set by get_current_user.
+current_user_id: ContextVar[str | None] = ContextVar("current_user_id", default=None)
 
-class CorrelationIdMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        correlation_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
-        response = await call_next(request)
-        response.headers["X-Request-ID"] = correlation_id
-        return response
+
+class CorrelationIdMiddleware:
+    """Echo the caller's X-Request-ID (or a new one) on every response."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("x-request-id") or str(uuid.uuid4())
+        token = current_request_id.set(request_id)
+        scope_token = current_scope.set(scope)
+        user_token = current_user_id.set(None)
+
+        async def send_with_request_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            current_user_id.reset(user_token)
+            current_scope.reset(scope_token)
+            current_request_id.reset(token)
@@ -0,0 +1,69 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.database import QueryStats, request_queries
+from app.metrics import (
+    db_queries_per_request,
+    first_request_duration,
+    http_duration,
+    http_requests,
+)
+from app.middleware.correlation_id import current_request_id
+
+
+class MetricsMiddleware:
+    """Record HTTP request count and duration for Prometheus.
+
+    Labelled by the matched route template (``/users/{user_id}``), never the
+    raw path, so ids in URLs don't create new series. Anything no route
+    matched is counted as ``unmatched``. Duration runs until the last body
+    chunk is sent, so streamed responses are timed in full. The SQL
+    statements run on the way are counted too, to surface N+1 patterns.
+    The first request each worker serves per route is also reported on its
+    own, to show what cold caches and connections cost.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._seen_routes: set[tuple[str, str]] = set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        queries = QueryStats()
+        token = request_queries.set(queries)
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            request_queries.reset(token)
+            route = scope.get("route")
+            path = route.path if route else "unmatched"
+            method = scope["method"]
+            http_requests.labels(method=method, path=path, status=status_code).inc()
+            exemplar = None
+            request_id = current_request_id.get()
+            if settings.metrics_exemplars and request_id:
+                exemplar = {"request_id": request_id[:64]}
+            http_duration.labels(method=method, path=path).observe(
+                duration, exemplar=exemplar
+            )
+            if (method, path) not in self._seen_routes:
+                self._seen_routes.add((method, path))
+                first_request_duration.labels(method=method, path=path).set(duration)
+            db_queries_per_request.labels(method=method, path=path).observe(
+                queries.count
+            )
@@ -1,49 +1,223 @@
+import math
 import time
+import logging
 
+from dataclasses import dataclass
 from fastapi import Request, status
+from starlette.datastructures import MutableHeaders
 from starlette.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.core import cache
 from app.core.config import settings
+from app.core.memory_backend import MemoryBackend, register_script_handler
+from app.auth.security import decode_token
 from app.metrics import rate_limit_decisions
 
+logger = logging.getLogger(__name__)
+
 EXCLUDED = {"/health", "/metrics", "/openapi.json"}
 
+# Tokens charged against the principal's bucket; unlisted routes cost 1.
+ROUTE_COSTS = {
+    "/auth/login": 5,
+    "/auth/register": 5,
+    "/auth/refresh": 2,
+}
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.url.path in EXCLUDED:
-            return await call_next(request)
+# GCRA over every bucket a request touches, decided in a single round trip.
+# KEYS: bucket keys. ARGV: (emission interval us, burst tolerance us, cost)
+# per key. A bucket stores its theoretical arrival time (TAT) in microseconds
+# of Redis server time, so all workers share one clock. Nothing is written
+# unless every bucket admits the request.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+local allowed = 1
+local retry_after = 0
+local binding = 1
+local binding_remaining = nil
+local binding_reset = 0
+local new_tats = {}
 
-        if not await cache.client():
-            return await call_next(request)
+for i, key in ipairs(KEYS) do
+  local interval = tonumber(ARGV[3 * i - 2])
+  local burst = tonumber(ARGV[3 * i - 1])
+  local cost = tonumber(ARGV[3 * i])
+  local tat = tonumber(redis.call('GET', key) or now)
+  if tat < now then
+    tat = now
+  end
+  local new_tat = tat + cost * interval
+  local allow_at = new_tat - burst
+  local remaining
+  local reset
+  if allow_at > now then
+    allowed = 0
+    if allow_at - now > retry_after then
+      retry_after = allow_at - now
+    end
+    remaining = math.floor((burst - (tat - now)) / interval)
+    reset = tat - now
+  else
+    remaining = math.floor((burst - (new_tat - now)) / interval)
+    reset = new_tat - now
+  end
+  if binding_remaining == nil or remaining < binding_remaining then
+    binding = i
+    binding_remaining = remaining
+    binding_reset = reset
+  end
+  new_tats[i] = new_tat
+end
+
+if allowed == 1 then
+  for i, key in ipairs(KEYS) do
+    local ttl = math.ceil((new_tats[i] - now) / 1000)
+    redis.call('SET', key, string.format('%.0f', new_tats[i]), 'PX', ttl)
+  end
+end
+
+return {allowed, binding, math.max(binding_remaining, 0),
+        math.ceil(retry_after / 1000), math.ceil(binding_reset / 1000)}
+"""
 
-        client_ip = request.client.host if request.client else "unknown"
-        key = f"rate_limit:{client_ip}"
-        capacity = settings.rate_limit_per_minute
-        refill_rate = capacity / 60.0
 
-        bucket_data = await cache.get(key)
-        current_time = time.time()
-        if bucket_data is None:
-            tokens = capacity - 1
+def _gcra(store: MemoryBackend, keys: list, args: list) -> list:
+    """GCRA_SCRIPT for the in-process backend; same arguments and result."""
+    now = time.time_ns() // 1000
+    allowed, retry_after = 1, 0
+    binding, binding_reset = 1, 0
+    binding_remaining: int | None = None
+    new_tats = []
+    for i, key in enumerate(keys):
+        interval, burst, cost = (int(arg) for arg in args[3 * i : 3 * i + 3])
+        tat = max(int(store.read(key) or now), now)
+        new_tat = tat + cost * interval
+        allow_at = new_tat - burst
+        if allow_at > now:
+            allowed = 0
+            retry_after = max(retry_after, allow_at - now)
+            remaining = (burst - (tat - now)) // interval
+            reset = tat - now
         else:
-            time_passed = current_time - bucket_data["last_refill"]
-            tokens = min(capacity, int(bucket_data["tokens"] + time_passed * refill_rate))
+            remaining = (burst - (new_tat - now)) // interval
+            reset = new_tat - now
+        if binding_remaining is None or remaining < binding_remaining:
+            binding, binding_remaining, binding_reset = i + 1, remaining, reset
+        new_tats.append(new_tat)
+
+    if allowed:
+        for key, new_tat in zip(keys, new_tats):
+            store.write(key, new_tat, ttl_ms=math.ceil((new_tat - now) / 1000))
+    return [
+        allowed,
+        binding,
+        max(binding_remaining or 0, 0),
+        math.ceil(retry_after / 1000),
+        math.ceil(binding_reset / 1000),
+    ]
+
+
+register_script_handler(GCRA_SCRIPT, _gcra)
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    name: str
+    limit: int
+    period: int = 60
+
+    @property
+    def interval_us(self) -> int:
+        return self.period * 1_000_000 // self.limit
+
+    @property
+    def burst_us(self) -> int:
+        return self.interval_us * self.limit
+
+
+# Extra per-route buckets, counted in requests and applied on top of the
+# principal's bucket.
+ROUTE_POLICIES = {
+    "/auth/login": RateLimitPolicy("login", settings.rate_limit_login_per_minute),
+    "/auth/register": RateLimitPolicy(
+        "register", settings.rate_limit_register_per_minute
+    ),
+}
+
 
-        if tokens < 0:
+def _principal(request: Request) -> tuple[str, RateLimitPolicy]:
+    """Rate-limit authenticated users by id, everyone else by client IP."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        payload = decode_token(token)
+        if payload and payload.get("type") != "refresh" and payload.get("sub"):
+            return f"user:{payload['sub']}", RateLimitPolicy(
+                "user", settings.rate_limit_user_per_minute
+            )
+
+    client_ip = request.client.host if request.client else "unknown"
+    return f"ip:{client_ip}", RateLimitPolicy("ip", settings.rate_limit_per_minute)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in EXCLUDED:
+            await self.app(scope, receive, send)
+            return
+
+        if not await cache.client():
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        principal, policy = _principal(Request(scope))
+        buckets = [(f"rate_limit:{principal}", policy, ROUTE_COSTS.get(path, 1))]
+        route_policy = ROUTE_POLICIES.get(path)
+        if route_policy:
+            buckets.append(
+                (f"rate_limit:{route_policy.name}:{principal}", route_policy, 1)
+            )
+
+        args = []
+        for _, bucket_policy, cost in buckets:
+            args += [bucket_policy.interval_us, bucket_policy.burst_us, cost]
+        try:
+            allowed, binding, remaining, retry_after_ms, reset_ms = (
+                await cache.run_script(
+                    GCRA_SCRIPT, [key for key, _, _ in buckets], args
+                )
+            )
+        except Exception:
+            logger.warning("Rate limiter unavailable, allowing request", exc_info=True)
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            "X-RateLimit-Limit": str(buckets[binding - 1][1].limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(math.ceil(reset_ms / 1000)),
+        }
+        if not allowed:
             rate_limit_decisions.labels(decisions="deny").inc()
-            return JSONResponse(
+            headers["Retry-After"] = str(max(1, math.ceil(retry_after_ms / 1000)))
+            response = JSONResponse(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 content={"detail": "Rate limit exceeded"},
-                headers={"X-RateLimit-Remaining": "0"},
+                headers=headers,
             )
+            await response(scope, receive, send)
+            return
 
         rate_limit_decisions.labels(decisions="allow").inc()
-        await cache.set(key, {"tokens": tokens, "last_refill": current_time}, expire=60)
 
-        response = await call_next(request)
-        response.headers["X-RateLimit-Limit"] = str(capacity)
-        response.headers["X-RateLimit-Remaining"] = str(int(tokens))
-        return response
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -3,14 +3,16 @@ import uuid
 from datetime import datetime, timezone
 from enum import Enum
 
-from sqlalchemy import Boolean, String, DateTime
+from sqlalchemy import Boolean, String, DateTime, Index
 from sqlalchemy import Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
+from app.core.codecs import register_enum
 from app.core.database import Base
 
 
+@register_enum
 class UserRole(str, Enum):
     ADMIN = "admin"
     USER = "user"
@@ -18,6 +20,21 @@ class UserRole(str, Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset pagination: ORDER BY (created_at, id), optionally filtered.
+        # Each filter needs its own index led by the filtered columns to read
+        # rows already in that order.
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_role_created_at_id", "role", "created_at", "id"),
+        Index("ix_users_is_active_created_at_id", "is_active", "created_at", "id"),
+        Index(
+            "ix_users_role_is_active_created_at_id",
+            "role",
+            "is_active",
+            "created_at",
+            "id",
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
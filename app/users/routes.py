@@ -1,65 +1,179 @@
 from uuid import UUID
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 
-from app.core import cache
 from app.core.database import get_session
-from app.core.deps import get_current_user, require_role
+from app.core.responses import OrjsonResponse, etag_matches
+from app.auth.schemas import Principal
+from app.core.deps import get_current_user, get_read_session, require_role
 from app.users.models import User, UserRole
-from app.users.schemas import UserResponse, UserUpdate
-from app.users.service import deactivate_user, get_user_by_id, get_users, update_user
+from app.users.schemas import (
+    UserBatchResponse,
+    UserImportResult,
+    UserResponse,
+    UserUpdate,
+)
+from app.users.service import (
+    deactivate_user,
+    export_users,
+    get_user_data,
+    get_users,
+    get_users_by_ids,
+    get_users_page,
+    import_users,
+    iter_lines,
+    update_user,
+    user_etag,
+    user_payload,
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Profiles are per-caller; clients revalidate with If-None-Match every time.
+USER_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def _user_response(request: Request, user: dict) -> Response:
+    """200 with the user, or an empty 304 when the client's ETag still matches."""
+    headers = {**USER_CACHE_HEADERS, "ETag": user_etag(user)}
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return OrjsonResponse(user_payload(user), headers=headers)
+
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_user)):
-    """Get current user profile."""
-    return current_user
+async def read_users_me(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_session),
+):
+    """Get current user profile; honours If-None-Match."""
+    user = await get_user_data(db, str(current_user.id))
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    return _user_response(request, user)
 
 
 @router.put("/me", response_model=UserResponse)
 async def update_user_me(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_session),
 ):
     """Update current user profile."""
-    return await update_user(db, current_user.id, user_update, cache)
+    user = await update_user(db, await db.get(User, current_user.id), user_update)
+    return OrjsonResponse(
+        user_payload(user), headers={**USER_CACHE_HEADERS, "ETag": user_etag(user)}
+    )
+
+
+@router.get("/export")
+async def export_users_stream(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    role: UserRole | None = None,
+    is_active: bool | None = None,
+    db: AsyncSession = Depends(get_read_session),
+    _: Principal = Depends(require_role(UserRole.ADMIN)),
+):
+    """Stream all users as NDJSON or CSV (admin only)."""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_users(db, format, role, is_active),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=users.{format}"},
+    )
+
+
+@router.get("/batch", response_model=UserBatchResponse)
+async def read_users_batch(
+    ids: list[UUID] = Query(..., max_length=100),
+    db: AsyncSession = Depends(get_read_session),
+    _: Principal = Depends(get_current_user),
+):
+    """Get up to 100 users by id, in request order; unknown ids are listed in
+    ``missing``."""
+    ids = list(dict.fromkeys(ids))
+    users = await get_users_by_ids(db, ids)
+    return OrjsonResponse(
+        {
+            "users": [
+                user_payload(users[user_id]) for user_id in ids if user_id in users
+            ],
+            "missing": [user_id for user_id in ids if user_id not in users],
+        }
+    )
 
 
 @router.get("/{user_id}", response_model=UserResponse)
 async def read_user(
+    request: Request,
     user_id: UUID,
-    db: AsyncSession = Depends(get_session),
-    _: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_session),
+    _: Principal = Depends(get_current_user),
 ):
-    """Get user by id"""
-    user = await get_user_by_id(db, str(user_id))
+    """Get user by id; honours If-None-Match."""
+    user = await get_user_data(db, str(user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    return user
+    return _user_response(request, user)
 
 
 @router.get("/", response_model=list[UserResponse])
 async def read_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: str | None = None,
+    role: UserRole | None = None,
+    is_active: bool | None = None,
+    db: AsyncSession = Depends(get_read_session),
+    _: Principal = Depends(require_role(UserRole.ADMIN)),
+):
+    """Get list of users (admin only).
+
+    Pages are ordered by creation time. Follow the ``X-Next-Cursor`` header
+    with ``?cursor=`` for constant-time deep pages; ``skip`` still works.
+    """
+    if skip:
+        if cursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Use either skip or cursor, not both",
+            )
+        return OrjsonResponse(await get_users(db, skip, limit, role, is_active))
+
+    try:
+        users, next_cursor = await get_users_page(db, limit, cursor, role, is_active)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return OrjsonResponse(users, headers=headers)
+
+
+@router.post("/import", response_model=UserImportResult)
+async def bulk_import_users(
+    request: Request,
     db: AsyncSession = Depends(get_session),
-    _: User = Depends(require_role(UserRole.ADMIN)),
+    _: Principal = Depends(require_role(UserRole.ADMIN)),
 ):
-    """Get list of users (admin only)."""
-    return await get_users(db, skip, limit)
+    """Bulk-create users from an NDJSON or CSV (with header row) body (admin only)."""
+    content_type = request.headers.get("content-type", "")
+    fmt = "csv" if content_type.startswith("text/csv") else "ndjson"
+    return await import_users(db, iter_lines(request.stream()), fmt)
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: UUID,
     db: AsyncSession = Depends(get_session),
-    _: User = Depends(require_role(UserRole.ADMIN)),
+    _: Principal = Depends(require_role(UserRole.ADMIN)),
 ):
     """Delete user (admin only)."""
     result = await db.execute(select(User).where(User.id == user_id))
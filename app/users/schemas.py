@@ -10,7 +10,7 @@ class UserCreate(BaseModel):
     email: EmailStr
     username: str = Field(..., min_length=3, max_length=50)
     password: str = Field(..., min_length=8)
-    full_name: str | None = None
+    full_name: str | None = Field(None, max_length=100)
     is_active: bool = True
     role: UserRole = UserRole.USER
 
@@ -18,7 +18,7 @@ class UserCreate(BaseModel):
 class UserUpdate(BaseModel):
     email: EmailStr | None = None
     username: str | None = Field(None, min_length=3, max_length=50)
-    full_name: str | None = None
+    full_name: str | None = Field(None, max_length=100)
     password: str | None = Field(None, min_length=8)
 
 
@@ -32,3 +32,23 @@ class UserResponse(BaseModel):
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+# Fields of a serialized user, in response order.
+USER_RESPONSE_FIELDS = tuple(UserResponse.model_fields)
+
+
+class ImportRowError(BaseModel):
+    line: int
+    detail: str
+
+
+class UserImportResult(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: list[ImportRowError] = []
+
+
+class UserBatchResponse(BaseModel):
+    users: list[UserResponse]
+    missing: list[UUID]
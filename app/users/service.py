@@ -1,38 +1,153 @@
-from sqlalchemy import select
+import io
+import csv
+import hmac
+import json
+import uuid
+import base64
+import time
+import hashlib
+
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from uuid import UUID
+from pydantic import ValidationError
+from sqlalchemy import any_, bindparam, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core import cache
-from app.users.models import User
-from app.users.schemas import UserUpdate
-from app.auth.security import get_password_hash
-from app.metrics import cache_hits, cache_misses
-
-
-async def get_user_by_id(db: AsyncSession, user_id: str):
-    """Fetch user by ID — check cache first, fall back to DB."""
-    cache_key = f"user:{user_id}"
-    cached_user = await cache.get(cache_key)
-    if cached_user:
-        cache_hits.labels(operation="get_user").inc()
-        return User(**cached_user)
-
-    cache_misses.labels(operation="get_user").inc()
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if user:
-        user_dict = {
-            "id": str(user.id),
-            "email": user.email,
-            "username": user.username,
-            "full_name": user.full_name,
-            "is_active": user.is_active,
-            "role": user.role.value,
-            "created_at": user.created_at.isoformat(),
-            "updated_at": user.updated_at_at.isoformat(),
-        }
-        await cache.set(cache_key, user_dict)
-    return user
+from app.core import cache, database
+from app.core.config import settings
+from app.users.models import User, UserRole
+from app.users.schemas import (
+    USER_RESPONSE_FIELDS,
+    ImportRowError,
+    UserCreate,
+    UserImportResult,
+    UserResponse,
+    UserUpdate,
+)
+from app.auth.security import hash_password, hash_passwords
+
+
+def _cacheable(user: User) -> dict:
+    return {
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "full_name": user.full_name,
+        "is_active": user.is_active,
+        "role": user.role,
+        "created_at": user.created_at,
+        "updated_at": user.updated_at,
+    }
+
+
+def _cache_ttl(db: AsyncSession) -> int:
+    """Entries filled from a replica may trail the primary, so keep them briefly."""
+    return settings.replica_cache_ttl_seconds if "replica" in db.info else 300
+
+
+# Columns loaded for listings: exactly what a response carries, so rows are
+# serialized as-is instead of hydrating and validating ORM objects.
+_response_columns = [getattr(User, field) for field in USER_RESPONSE_FIELDS]
+
+
+def user_payload(user: dict | User) -> dict:
+    """Response body for one user, from a cached dict or an ORM object."""
+    if isinstance(user, dict):
+        return {field: user[field] for field in USER_RESPONSE_FIELDS}
+    return {field: getattr(user, field) for field in USER_RESPONSE_FIELDS}
+
+
+def user_etag(user: dict | User) -> str:
+    """Weak ETag for a user's representation, from its id and ``updated_at``."""
+    if not isinstance(user, dict):
+        user = _cacheable(user)
+    version = f"{user['id']}:{user['updated_at'].isoformat()}".encode()
+    return f'W/"{hashlib.blake2b(version, digest_size=8).hexdigest()}"'
+
+
+async def get_user_data(db: AsyncSession, user_id: str) -> dict | None:
+    """Fetch user by ID as a plain dict — check in-process and Redis cache
+    first, fall back to DB."""
+    key = f"user:{user_id}"
+
+    async def load_user():
+        # The load may be shared with (and outlive) other requests, so it
+        # runs on its own session against the same database as ``db``.
+        async with database.session_like(db) as session:
+            result = await session.execute(select(User).where(User.id == user_id))
+            user = result.scalar_one_or_none()
+        return _cacheable(user) if user else None
+
+    if db.info.get("read_your_writes"):
+        # The caller wrote within the stickiness window: read the primary and
+        # repair the cache, which a lagging replica may have refilled since.
+        user = await load_user()
+        if user:
+            await cache.set_many({key: user})
+        return user
+    if (
+        "replica" in db.info
+        and cache.local.get(key) is None
+        and await cache.get(f"written:{user_id}")
+    ):
+        # Changed moments ago: a lagging replica must not refill the cache.
+        return await load_user()
+
+    return await cache.get_or_set(
+        key, load_user, ttl=_cache_ttl(db), operation="get_user"
+    )
+
+
+async def get_users_by_ids(db: AsyncSession, user_ids: list[UUID]) -> dict:
+    """Fetch many users by ID with one MGET, one query for the misses and one
+    pipelined cache write. Returns {id: user dict} for the ids that exist."""
+    keys = {user_id: f"user:{user_id}" for user_id in user_ids}
+    users = {}
+    if not db.info.get("read_your_writes"):
+        cached = await cache.get_many(list(keys.values()), operation="get_user")
+        users = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+
+    missing = [user_id for user_id in keys if user_id not in users]
+    if missing:
+        start = time.perf_counter()
+        result = await db.execute(
+            select(User).where(
+                User.id == any_(bindparam("ids", missing, type_=ARRAY(PG_UUID)))
+            )
+        )
+        loaded = {user.id: _cacheable(user) for user in result.scalars()}
+        fill = {keys[user_id]: data for user_id, data in loaded.items()}
+        if "replica" in db.info and loaded:
+            written = await cache.mget([f"written:{user_id}" for user_id in loaded])
+            fill = {
+                key: data
+                for (key, data), recent in zip(fill.items(), written)
+                if not recent
+            }
+        await cache.set_many(
+            fill, ttl=_cache_ttl(db), compute_time=time.perf_counter() - start
+        )
+        users.update(loaded)
+    return users
+
+
+async def preload_recent_users(db: AsyncSession, limit: int) -> int:
+    """Cache the ``limit`` most recently updated active users, as
+    ``get_user_data`` would. Returns how many were loaded."""
+    start = time.perf_counter()
+    result = await db.execute(
+        select(User)
+        .where(User.is_active.is_(True))
+        .order_by(User.updated_at.desc())
+        .limit(limit)
+    )
+    loaded = {f"user:{user.id}": _cacheable(user) for user in result.scalars()}
+    await cache.set_many(
+        loaded, ttl=_cache_ttl(db), compute_time=time.perf_counter() - start
+    )
+    return len(loaded)
 
 
 async def deactivate_user(db: AsyncSession, user: User):
@@ -40,24 +155,263 @@ async def deactivate_user(db: AsyncSession, user: User):
     user.is_active = False
     await db.flush()
     await db.commit()
-    await cache.delete(f"user:{user.id}")
+    await invalidate_user_cache(user.id)
+
+
+def _filtered_users(role: UserRole | None, is_active: bool | None, *columns):
+    query = select(*columns or (User,)).order_by(User.created_at, User.id)
+    if role is not None:
+        query = query.where(User.role == role)
+    if is_active is not None:
+        query = query.where(User.is_active == is_active)
+    return query
+
+
+def _sign(data: bytes) -> bytes:
+    return hmac.new(settings.secret_key.encode(), data, hashlib.sha256).digest()[:16]
+
+
+def encode_cursor(user) -> str:
+    """Opaque, signed position after ``user`` (a User or a row) in
+    (created_at, id) order."""
+    data = json.dumps([user.created_at.isoformat(), str(user.id)]).encode()
+    return ".".join(
+        base64.urlsafe_b64encode(part).decode().rstrip("=")
+        for part in (data, _sign(data))
+    )
 
 
-async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100) -> list[User]:
-    result = await db.execute(select(User).offset(skip).limit(limit))
-    return list(result.scalars().all())
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """Raises ValueError if the cursor is malformed or was not issued by us."""
+    try:
+        data, signature = (
+            base64.urlsafe_b64decode(part + "=" * (-len(part) % 4))
+            for part in cursor.split(".")
+        )
+        if not hmac.compare_digest(signature, _sign(data)):
+            raise ValueError("bad signature")
+        created_at, user_id = json.loads(data)
+        return datetime.fromisoformat(created_at), UUID(user_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+async def get_users(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    role: UserRole | None = None,
+    is_active: bool | None = None,
+) -> list[dict]:
+    """Offset pagination — kept for compatibility, cost grows with ``skip``."""
+    result = await db.execute(
+        _filtered_users(role, is_active, *_response_columns).offset(skip).limit(limit)
+    )
+    return [row._asdict() for row in result]
+
+
+async def get_users_page(
+    db: AsyncSession,
+    limit: int = 100,
+    cursor: str | None = None,
+    role: UserRole | None = None,
+    is_active: bool | None = None,
+) -> tuple[list[dict], str | None]:
+    """Keyset pagination over (created_at, id); returns the page and next cursor."""
+    query = _filtered_users(role, is_active, *_response_columns).limit(limit + 1)
+    if cursor:
+        query = query.where(tuple_(User.created_at, User.id) > decode_cursor(cursor))
+    result = await db.execute(query)
+    users = list(result)
+    next_cursor = encode_cursor(users[limit - 1]) if len(users) > limit else None
+    return [row._asdict() for row in users[:limit]], next_cursor
 
 
 async def update_user(db: AsyncSession, user: User, user_update: UserUpdate):
     update_data = user_update.model_dump(exclude_unset=True)
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await hash_password(
+            update_data.pop("password")
+        )
     for field, value in update_data.items():
         setattr(user, field, value)
 
     await db.flush()
     await db.refresh(user)
     await db.commit()
-    await cache.delete(f"user:{user.id}")
+    await invalidate_user_cache(user.id)
 
     return user
+
+
+async def invalidate_user_cache(user_id):
+    """Drop cached profile and principal after any change to the user row.
+
+    Must follow every write that can change role or is_active, so callers
+    changing roles go through here as well.
+    """
+    await cache.incr(f"user_version:{user_id}")
+    await cache.invalidate(f"user:{user_id}", f"principal:{user_id}")
+    if database.replicas:
+        # Replicas may still serve the old row; see get_user_data.
+        await cache.set(f"written:{user_id}", 1, expire=settings.replica_sticky_seconds)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes | None]:
+    """Split a streamed request body into lines without buffering all of it.
+
+    Yields each line's raw bytes, or ``None`` in place of a line longer than
+    ``import_max_line_bytes``, whose bytes are dropped rather than held.
+    """
+    pending: list[bytes] = []
+    size = 0
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            piece = chunk[start:] if end == -1 else chunk[start:end]
+            if not oversized:
+                size += len(piece)
+                if size > settings.import_max_line_bytes:
+                    oversized, pending = True, []
+                else:
+                    pending.append(piece)
+            if end == -1:
+                break
+            yield None if oversized else b"".join(pending)
+            pending, size, oversized = [], 0, False
+            start = end + 1
+    if size or oversized:
+        yield None if oversized else b"".join(pending)
+
+
+async def _parse_rows(lines: AsyncIterator[bytes | None], fmt: str):
+    """Yield (line number, row dict or error message) for NDJSON or CSV input."""
+    header = None
+    number = 0
+    async for raw in lines:
+        number += 1
+        if raw is None:
+            yield number, f"Line longer than {settings.import_max_line_bytes} bytes"
+            continue
+        try:
+            line = raw.decode().rstrip("\r")
+            if not line.strip():
+                continue
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = values
+                    continue
+                row = {k: v for k, v in zip(header, values) if v != ""}
+            else:
+                row = json.loads(line)
+        except (ValueError, csv.Error) as exc:
+            yield number, f"Malformed row: {exc}"
+            continue
+        yield number, row
+
+
+async def _insert_batch(
+    db: AsyncSession, batch: list[tuple[int, UserCreate]], result: UserImportResult
+):
+    hashes = await hash_passwords([user_in.password for _, user_in in batch])
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "email": user_in.email,
+            "username": user_in.username,
+            "full_name": user_in.full_name,
+            "hashed_password": hashed_password,
+            "is_active": user_in.is_active,
+            "role": user_in.role,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for (_, user_in), hashed_password in zip(batch, hashes)
+    ]
+    inserted = await db.execute(
+        insert(User).on_conflict_do_nothing().returning(User.id), rows
+    )
+    inserted_ids = set(inserted.scalars().all())
+    await db.commit()
+
+    result.inserted += len(inserted_ids)
+    for (number, _), row in zip(batch, rows):
+        if row["id"] not in inserted_ids:
+            _record_error(result, number, "Email or username already registered")
+
+
+def _record_error(result: UserImportResult, line: int, detail: str):
+    result.failed += 1
+    if len(result.errors) < settings.import_max_reported_errors:
+        result.errors.append(ImportRowError(line=line, detail=detail))
+
+
+async def import_users(
+    db: AsyncSession, lines: AsyncIterator[bytes | None], fmt: str
+) -> UserImportResult:
+    """Bulk-create users from NDJSON or CSV lines.
+
+    Rows are validated with ``UserCreate``, hashed in parallel off the event
+    loop and inserted in batches of ``import_batch_size`` with ON CONFLICT DO
+    NOTHING, so a duplicate fails its row rather than the batch. Only one
+    batch is held in memory at a time.
+    """
+    result = UserImportResult()
+    batch: list[tuple[int, UserCreate]] = []
+    async for number, row in _parse_rows(lines, fmt):
+        if isinstance(row, str):
+            _record_error(result, number, row)
+            continue
+        try:
+            batch.append((number, UserCreate.model_validate(row)))
+        except ValidationError as exc:
+            _record_error(result, number, str(exc.errors()[0]["msg"]))
+            continue
+        if len(batch) >= settings.import_batch_size:
+            await _insert_batch(db, batch, result)
+            batch = []
+    if batch:
+        await _insert_batch(db, batch, result)
+    return result
+
+
+EXPORT_COLUMNS = list(UserResponse.model_fields)
+
+
+async def export_users(
+    db: AsyncSession,
+    fmt: str,
+    role: UserRole | None = None,
+    is_active: bool | None = None,
+) -> AsyncIterator[str]:
+    """Yield the user table as NDJSON or CSV, one chunk per fetched batch.
+
+    Reads plain column rows through a server-side cursor, so neither the
+    result set nor ORM identities accumulate in memory.
+    """
+    query = _filtered_users(
+        role, is_active, *(getattr(User, column) for column in EXPORT_COLUMNS)
+    ).execution_options(yield_per=settings.export_batch_size)
+    result = await db.stream(query)
+
+    if fmt == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\n"
+    async for rows in result.partitions():
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow(
+                    value.value if isinstance(value, UserRole) else value
+                    for value in row
+                )
+            yield buffer.getvalue()
+        else:
+            yield "".join(
+                UserResponse.model_validate(row._mapping).model_dump_json() + "\n"
+                for row in rows
+            )
@@ -0,0 +1,30 @@
+"""Gunicorn settings for running several uvicorn workers per container.
+
+    PROMETHEUS_MULTIPROC_DIR=/tmp/prometheus gunicorn app.main:app
+
+With PROMETHEUS_MULTIPROC_DIR set, /metrics reports the whole container.
+"""
+
+import os
+import glob
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+
+def on_starting(server):
+    # Samples left by a previous container run would be summed into this one.
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        # Only the sample files: the directory may be shared, e.g. /tmp.
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # Also covers workers that crashed before running the app's shutdown.
+    from app.metrics import mark_worker_dead
+
+    mark_worker_dead(worker.pid)
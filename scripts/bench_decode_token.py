@@ -0,0 +1,34 @@
+"""Compare per-request token decode cost with and without the verified-token cache.
+
+    python -m scripts.bench_decode_token --iterations 100000
+"""
+import argparse
+import timeit
+
+import jwt
+
+from app.auth.security import ALGORITHM, create_access_token, decode_token
+from app.core.config import settings
+
+
+def main(iterations: int):
+    token = create_access_token("00000000-0000-0000-0000-000000000000")
+    decode_token(token)
+
+    uncached = timeit.timeit(
+        lambda: jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM]),
+        number=iterations,
+    )
+    cached = timeit.timeit(lambda: decode_token(token), number=iterations)
+
+    print(f"iterations:        {iterations}")
+    print(f"jwt.decode:        {uncached / iterations * 1e6:.2f} us/request")
+    print(f"cached decode:     {cached / iterations * 1e6:.2f} us/request")
+    print(f"speedup:           {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,139 @@
+"""Per-request overhead of the middleware stack, BaseHTTPMiddleware vs ASGI.
+
+Drives the ASGI callables directly (no HTTP client, no socket) against an
+endpoint that does nothing, so the numbers are the middleware cost alone:
+
+    python -m scripts.bench_middleware --requests 20000
+
+Stacks compared, each three layers deep like the app's own
+(correlation id, metrics, rate limit):
+
+- ``base_http_passthrough``: three ``BaseHTTPMiddleware`` layers that only
+  ``await call_next(request)`` -- the floor of the old implementation.
+- ``asgi_passthrough``: three pure ASGI layers that only call the next app.
+- ``app_stack``: the app's real middleware, rate limiting against the
+  in-process memory backend.
+
+Overhead is reported as microseconds per request above the bare endpoint.
+"""
+
+import time
+import asyncio
+import argparse
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+
+async def endpoint(request):
+    return PlainTextResponse("ok")
+
+
+async def passthrough_dispatch(request, call_next):
+    return await call_next(request)
+
+
+class AsgiPassthrough:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+
+def build(middleware: list[Middleware]) -> Starlette:
+    return Starlette(routes=[Route("/bench", endpoint)], middleware=middleware)
+
+
+def stacks() -> dict[str, Starlette]:
+    from app.middleware.correlation_id import CorrelationIdMiddleware
+    from app.middleware.metrics import MetricsMiddleware
+    from app.middleware.rate_limit import RateLimitMiddleware
+
+    return {
+        "bare": build([]),
+        "base_http_passthrough": build(
+            [Middleware(BaseHTTPMiddleware, dispatch=passthrough_dispatch)] * 3
+        ),
+        "asgi_passthrough": build([Middleware(AsgiPassthrough)] * 3),
+        "app_stack": build(
+            [
+                Middleware(CorrelationIdMiddleware),
+                Middleware(MetricsMiddleware),
+                Middleware(RateLimitMiddleware),
+            ]
+        ),
+    }
+
+
+async def measure(app, requests: int) -> float:
+    """Mean seconds per request for a GET /bench through ``app``."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/bench",
+        "raw_path": b"/bench",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(min(requests, 1000)):
+        await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+async def run(requests: int, rounds: int) -> dict[str, float]:
+    from app.core import cache
+    from app.core.config import settings
+
+    settings.redis_url = "memory://"
+    settings.rate_limit_per_minute = 1_000_000
+    await cache.connect()
+    try:
+        best: dict[str, float] = {}
+        for _ in range(rounds):
+            for name, app in stacks().items():
+                seconds = await measure(app, requests)
+                best[name] = min(best.get(name, seconds), seconds)
+        return best
+    finally:
+        await cache.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3, help="best of N")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.requests, args.rounds))
+    bare = results["bare"]
+    for name, seconds in results.items():
+        print(
+            f"{name:24} {seconds * 1e6:8.1f} us/request"
+            f"   overhead {(seconds - bare) * 1e6:7.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Measure rate limiter cost per request: Redis commands issued and latency.
+
+Drives the app in-process against the Redis configured by REDIS_URL:
+
+    python -m scripts.bench_rate_limit --requests 2000
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from app.core import cache
+from app.main import app
+
+
+async def main(requests: int, path: str):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    await cache.connect()
+    redis = await cache.client()
+    await redis.flushdb()
+
+    commands = 0
+    execute_command = redis.execute_command
+
+    async def counting_execute_command(*args, **kwargs):
+        nonlocal commands
+        commands += 1
+        return await execute_command(*args, **kwargs)
+
+    redis.execute_command = counting_execute_command
+
+    latencies = []
+    transport = ASGITransport(app=app, client=("10.0.0.1", 1234))
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(requests):
+            start = time.perf_counter()
+            await client.get(path)
+            latencies.append(time.perf_counter() - start)
+
+    await cache.disconnect()
+
+    latencies.sort()
+    print(f"requests:              {requests}")
+    print(f"redis commands:        {commands}")
+    print(f"redis ops per request: {commands / requests:.2f}")
+    print(f"p50 latency:           {statistics.median(latencies) * 1000:.3f} ms")
+    print(f"p99 latency:           {latencies[int(len(latencies) * 0.99)] * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--path", default="/users/me")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.path))
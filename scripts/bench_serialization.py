@@ -0,0 +1,79 @@
+"""Compare per-page serialization cost of the user list response.
+
+    python -m scripts.bench_serialization --page-size 100 --iterations 2000
+
+legacy:   ORM objects -> UserResponse.model_validate -> jsonable_encoder -> json.dumps
+fastapi:  ORM objects -> TypeAdapter validation -> dump_json (FastAPI's default today)
+orjson:   ORM objects -> user_payload dicts -> OrjsonResponse (the users routes)
+
+All three start from the same ORM objects and include the conversion to
+whatever they serialize. The listing routes build their dicts from
+response-column rows rather than ORM objects, which is cheaper still.
+"""
+
+import json
+import uuid
+import argparse
+import timeit
+
+from datetime import datetime, timezone
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.core.responses import OrjsonResponse
+from app.users.models import User, UserRole
+from app.users.schemas import UserResponse
+from app.users.service import user_payload
+
+
+def main(page_size: int, iterations: int):
+    now = datetime.now(timezone.utc)
+    users = [
+        User(
+            id=uuid.uuid4(),
+            email=f"user{i}@example.com",
+            username=f"user{i}",
+            hashed_password="x",
+            full_name="Benchmark User",
+            is_active=True,
+            role=UserRole.USER,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(page_size)
+    ]
+    adapter = TypeAdapter(list[UserResponse])
+
+    def legacy():
+        return json.dumps(
+            jsonable_encoder([UserResponse.model_validate(user) for user in users])
+        ).encode()
+
+    def fastapi():
+        return adapter.dump_json(adapter.validate_python(users, from_attributes=True))
+
+    def orjson_dicts():
+        return OrjsonResponse([user_payload(user) for user in users]).body
+
+    assert json.loads(fastapi()) == json.loads(orjson_dicts())
+
+    print(f"page size:   {page_size}")
+    baseline = None
+    for name, render in (
+        ("legacy", legacy),
+        ("fastapi", fastapi),
+        ("orjson", orjson_dicts),
+    ):
+        per_page = timeit.timeit(render, number=iterations) / iterations
+        baseline = baseline or per_page
+        print(
+            f"{name + ':':<12} {per_page * 1e6:8.1f} us/page  {baseline / per_page:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.page_size, args.iterations)
@@ -0,0 +1,270 @@
+"""End-to-end load benchmark with per-endpoint latency and regression gates.
+
+Each virtual user repeatedly runs a session: register, log in, a weighted
+mix of /users/me, /users/{id} and (for admins) the user listing, then log
+out. Results are printed (or written with --output) as JSON:
+
+    python -m scripts.load_test --users 20 --duration 30 --output results.json
+    python -m scripts.load_test --save-baseline scripts/load_baseline.json
+    python -m scripts.load_test --baseline scripts/load_baseline.json
+
+By default the app (app.main:app) runs in-process through httpx's ASGI
+transport, using the Postgres and Redis from DATABASE_URL / REDIS_URL (e.g.
+the docker-compose services, or REDIS_URL=memory:// for the in-process
+cache backend). Per-IP and per-user rate limits and load shedding are
+lifted and every session gets its own client IP, so the numbers measure the
+app, not the limiters. With --base-url the same traffic goes to a running
+server instead, and every session then shares this machine's IP: start the
+server with limits to match, e.g. RATE_LIMIT_PER_MINUTE,
+RATE_LIMIT_LOGIN_PER_MINUTE and RATE_LIMIT_REGISTER_PER_MINUTE all set to
+1000000.
+
+With --baseline, exits 1 if any endpoint's p95/p99 latency grew or its
+throughput fell by more than --max-regression (a fraction), or if its error
+rate exceeds --max-error-rate. The results record the options they were
+produced with, and a baseline from different options is reported. Latency
+and throughput depend on the machine: scripts/load_baseline.json was made
+in-process with the default options against a local Postgres and
+REDIS_URL=memory://, and is a starting point, not a target; re-save it
+(--save-baseline) on the machine that runs the comparison.
+"""
+
+import json
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+import time
+
+from contextlib import AsyncExitStack
+from httpx import ASGITransport, AsyncClient
+
+PASSWORD = "loadtest-password"
+
+# Relative frequency of each read in a session.
+READ_MIX = {"me": 50, "user_by_id": 35, "list_users": 15}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def call(self, name: str, request, expected=(200, 201, 204, 304)):
+        start = time.perf_counter()
+        response = await request
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def run_config(args) -> dict:
+    """The options that shape the numbers, recorded alongside them."""
+    return {
+        "mode": args.base_url or "in-process",
+        "users": args.users,
+        "duration_s": args.duration,
+        "reads": args.reads,
+        "seed": args.seed,
+    }
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for name, samples in sorted(recorder.latencies.items()):
+        ordered = sorted(samples)
+        endpoints[name] = {
+            "requests": len(ordered),
+            "errors": recorder.errors.get(name, 0),
+            "throughput_rps": round(len(ordered) / elapsed, 2),
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+
+def compare(
+    results: dict, baseline: dict, max_regression: float, max_error_rate: float
+):
+    """Return a list of human-readable regressions (empty when all gates pass)."""
+    failures = []
+    if results.get("config") != baseline.get("config"):
+        print(
+            f"NOTE baseline was run with {baseline.get('config')},"
+            f" this run with {results.get('config')}"
+        )
+    for name, current in results["endpoints"].items():
+        if current["errors"] / current["requests"] > max_error_rate:
+            failures.append(
+                f"{name}: error rate {current['errors']}/{current['requests']}"
+            )
+        before = baseline["endpoints"].get(name)
+        if not before:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if current[metric] > before[metric] * (1 + max_regression):
+                failures.append(
+                    f"{name}: {metric} {current[metric]} > baseline {before[metric]}"
+                )
+        if current["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+            failures.append(
+                f"{name}: throughput {current['throughput_rps']} rps"
+                f" < baseline {before['throughput_rps']} rps"
+            )
+    return failures
+
+
+async def session(client: AsyncClient, recorder: Recorder, user_ids: list, reads: int):
+    name = f"load_{uuid.uuid4().hex[:12]}"
+    admin = random.random() < 0.1
+    registered = await recorder.call(
+        "register",
+        client.post(
+            "/auth/register",
+            json={
+                "email": f"{name}@example.com",
+                "username": name,
+                "password": PASSWORD,
+                "role": "admin" if admin else "user",
+            },
+        ),
+    )
+    if registered.status_code != 201:
+        return
+    user_ids.append(registered.json()["id"])
+
+    login = await recorder.call(
+        "login",
+        client.post("/auth/login", json={"username": name, "password": PASSWORD}),
+    )
+    if login.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    mix = (
+        dict(READ_MIX)
+        if admin
+        else {k: v for k, v in READ_MIX.items() if k != "list_users"}
+    )
+    for read in random.choices(list(mix), weights=list(mix.values()), k=reads):
+        if read == "me":
+            await recorder.call("me", client.get("/users/me", headers=headers))
+        elif read == "user_by_id":
+            user_id = random.choice(user_ids)
+            await recorder.call(
+                "user_by_id", client.get(f"/users/{user_id}", headers=headers)
+            )
+        else:
+            await recorder.call(
+                "list_users", client.get("/users/?limit=50", headers=headers)
+            )
+
+    await recorder.call("logout", client.post("/auth/logout", headers=headers))
+
+
+async def virtual_user(index: int, make_client, recorder, user_ids, deadline, reads):
+    sessions = 0
+    while time.monotonic() < deadline:
+        # A fresh client IP per session keeps per-IP register/login limits out
+        # of the measurement.
+        async with make_client(
+            f"10.{index // 256}.{index % 256}.{sessions % 250 + 1}"
+        ) as client:
+            await session(client, recorder, user_ids, reads)
+        sessions += 1
+
+
+async def run(args) -> dict:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    random.seed(args.seed)
+    recorder = Recorder()
+    user_ids: list[str] = []
+
+    async with AsyncExitStack() as stack:
+        if args.base_url:
+
+            def make_client(ip):
+                return AsyncClient(base_url=args.base_url, timeout=30)
+
+        else:
+            from app.core.config import settings
+
+            settings.rate_limit_per_minute = 1_000_000
+            settings.rate_limit_user_per_minute = 1_000_000
+            # Read when app.main is imported. The load generator shares the
+            # app's event loop, so the limiter would shed on its overhead.
+            settings.concurrency_limit_enabled = False
+            from app.main import app
+
+            await stack.enter_async_context(app.router.lifespan_context(app))
+
+            def make_client(ip):
+                transport = ASGITransport(app=app, client=(ip, 12345))
+                return AsyncClient(transport=transport, base_url="http://load-test")
+
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(
+                virtual_user(
+                    index, make_client, recorder, user_ids, deadline, args.reads
+                )
+                for index in range(args.users)
+            )
+        )
+        elapsed = time.monotonic() - start
+
+    return {"config": run_config(args), **summarize(recorder, elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--users", type=int, default=20, help="concurrent virtual users"
+    )
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--reads", type=int, default=20, help="reads per session")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-url", help="target a running server instead")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="write results as the new baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report = json.dumps(results, indent=2)
+    print(report)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            f.write(report + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.max_regression, args.max_error_rate)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
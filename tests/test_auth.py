@@ -1,5 +1,13 @@
+import asyncio
+
 from httpx import AsyncClient
 
+from app.auth import revocation
+from app.auth.revocation import BloomFilter
+from app.auth.security import create_access_token, decode_token
+from app.core import cache
+from app.core.config import settings
+
 
 async def test_register(client: AsyncClient, user_data):
     r = await client.post("/auth/register", json=user_data)
@@ -102,6 +110,146 @@ async def test_logout_revokes_token(client: AsyncClient, user_data):
     )  # 401 if Redis available, 200 if graceful degradation
 
 
+async def _login(client: AsyncClient, user_data):
+    await client.post("/auth/register", json=user_data)
+    login = await client.post(
+        "/auth/login",
+        json={
+            "username": user_data["username"],
+            "password": user_data["password"],
+        },
+    )
+    return login.json()
+
+
+async def test_logout_revokes_only_that_token(
+    client: AsyncClient, user_data, redis_cache
+):
+    await revocation.sync()
+    try:
+        first = await _login(client, user_data)
+        second = await _login(client, user_data)
+
+        r = await client.post(
+            "/auth/logout", headers={"Authorization": f"Bearer {first['access_token']}"}
+        )
+        assert r.status_code == 204
+
+        r = await client.get(
+            "/users/me", headers={"Authorization": f"Bearer {first['access_token']}"}
+        )
+        assert r.status_code == 401
+        r = await client.get(
+            "/users/me", headers={"Authorization": f"Bearer {second['access_token']}"}
+        )
+        assert r.status_code == 200
+    finally:
+        await revocation.stop()
+
+
+async def test_logout_all_revokes_every_session(
+    client: AsyncClient, user_data, redis_cache
+):
+    first = await _login(client, user_data)
+    second = await _login(client, user_data)
+
+    r = await client.post(
+        "/auth/logout-all",
+        headers={"Authorization": f"Bearer {first['access_token']}"},
+    )
+    assert r.status_code == 204
+
+    r = await client.get(
+        "/users/me", headers={"Authorization": f"Bearer {second['access_token']}"}
+    )
+    assert r.status_code == 401
+    r = await client.post(
+        "/auth/refresh", params={"refresh_token": second["refresh_token"]}
+    )
+    assert r.status_code == 401
+
+    # Logging in again issues tokens for the new generation.
+    third = await _login(client, user_data)
+    r = await client.get(
+        "/users/me", headers={"Authorization": f"Bearer {third['access_token']}"}
+    )
+    assert r.status_code == 200
+
+
+async def test_revocations_missed_while_listener_down_still_apply(
+    client: AsyncClient, user_data, redis_cache
+):
+    await revocation.sync()
+    try:
+        tokens = await _login(client, user_data)
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        payload = decode_token(tokens["access_token"])
+
+        # Drop this worker's pub/sub listener.
+        handler = cache._handlers[settings.revocation_channel]
+
+        def drop(message: str):
+            cache._handlers[settings.revocation_channel] = handler
+            raise ConnectionError("connection lost")
+
+        cache._handlers[settings.revocation_channel] = drop
+        await cache.publish(settings.revocation_channel, "ping")
+        for _ in range(100):
+            if not revocation._synced:
+                break
+            await asyncio.sleep(0.01)
+        assert not revocation._synced
+
+        # Another worker revokes the token; its publish never reaches us.
+        await cache.set(f"revoked:{payload['jti']}", 1, expire=60)
+        await cache.zadd(revocation.REVOKED_SET, payload["jti"], payload["exp"])
+
+        r = await client.get("/users/me", headers=headers)
+        assert r.status_code == 401
+
+        # After resubscribing, the filter is rebuilt with the missed jti.
+        for _ in range(300):
+            if revocation._synced:
+                break
+            await asyncio.sleep(0.01)
+        assert revocation._synced
+        assert payload["jti"] in revocation._bloom
+        r = await client.get("/users/me", headers=headers)
+        assert r.status_code == 401
+    finally:
+        await revocation.stop()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    members = [f"jti-{i}" for i in range(1000)]
+    for member in members:
+        bloom.add(member)
+
+    assert all(member in bloom for member in members)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+def test_decode_token_cache_never_serves_tampered_tokens():
+    token = create_access_token("some-user")
+    assert decode_token(token)["sub"] == "some-user"
+    assert decode_token(token)["sub"] == "some-user"
+
+    header, claims, signature = token.split(".")
+    assert decode_token(f"{header}.{claims}.{signature[::-1]}") is None
+
+
+async def test_register_sheds_load_when_hash_pool_full(
+    client: AsyncClient, user_data, monkeypatch
+):
+    monkeypatch.setattr(settings, "password_hash_workers", 0)
+    monkeypatch.setattr(settings, "password_hash_queue_size", 0)
+    r = await client.post("/auth/register", json=user_data)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+
 async def test_correlation_id_in_response(client: AsyncClient):
     """Every response should contain X-Request-ID header."""
     r = await client.get("/health")
@@ -0,0 +1,228 @@
+import json
+import time
+import uuid
+import asyncio
+
+from datetime import datetime, timezone
+from enum import Enum
+
+import msgpack
+import pytest
+
+from app.core import cache, codecs
+from app.core.cache import LocalCache
+from app.core.config import settings
+from app.core.memory_backend import MemoryBackend
+from app.users.models import UserRole
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_entries=2, ttl=60)
+    local.set("a", 1)
+    local.set("b", 2)
+    assert local.get("a") == 1
+    local.set("c", 3)
+
+    assert local.get("b") is None
+    assert local.get("a") == 1
+    assert local.get("c") == 3
+
+
+def test_local_cache_expires_entries():
+    local = LocalCache(max_entries=10, ttl=60)
+    local.set("a", 1, ttl=0.01)
+    local.set("b", 2)
+    assert local.get("a") == 1
+
+    time.sleep(0.02)
+    assert local.get("a") is None
+    assert local.get("b") == 2
+    assert len(local) == 1
+
+
+async def test_get_or_set_populates_both_tiers(redis_cache):
+    async def loader():
+        return {"id": "42"}
+
+    assert await cache.get_or_set("user:42", loader) == {"id": "42"}
+    assert cache.local.get("user:42") == {"id": "42"}
+    assert (await cache.get("user:42"))["v"] == {"id": "42"}
+
+
+async def test_get_or_set_coalesces_concurrent_misses(redis_cache):
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"id": "42"}
+
+    results = await asyncio.gather(
+        *(cache.get_or_set("user:42", loader) for _ in range(20))
+    )
+    assert results == [{"id": "42"}] * 20
+    assert calls == 1
+
+
+async def test_get_or_set_coalesces_misses_racing_the_redis_read(
+    redis_cache, monkeypatch
+):
+    store = await cache.client()
+    read = store.get
+
+    async def slow_get(key):
+        # Reads the value now but answers late, like a slow round trip.
+        value = await read(key)
+        await asyncio.sleep(0.05)
+        return value
+
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": "42"}
+
+    first = asyncio.create_task(cache.get_or_set("user:42", loader))
+    await asyncio.sleep(0)
+    monkeypatch.setattr(store, "get", slow_get)
+    second = asyncio.create_task(cache.get_or_set("user:42", loader))
+    assert await asyncio.gather(first, second) == [{"id": "42"}] * 2
+    assert calls == 1
+
+
+async def test_get_or_set_treats_plain_values_as_misses(redis_cache):
+    await cache.set("user:1", {"id": "1", "username": "old-format"})
+
+    async def loader():
+        return {"id": "1", "username": "fresh"}
+
+    assert await cache.get_many(["user:1"]) == {}
+    assert await cache.get_or_set("user:1", loader) == {"id": "1", "username": "fresh"}
+
+
+async def test_get_or_set_does_not_cache_none():
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return None
+
+    assert await cache.get_or_set("user:missing", loader) is None
+    assert await cache.get_or_set("user:missing", loader) is None
+    assert calls == 2
+
+
+async def test_invalidation_is_broadcast_to_local_caches(redis_cache):
+    cache.local.set("user:42", {"id": "42"})
+    redis = await cache.client()
+    # Wait for the listener to subscribe, then publish as another worker would.
+    for _ in range(50):
+        if await redis.publish(settings.cache_invalidation_channel, "user:42"):
+            break
+        await asyncio.sleep(0.01)
+
+    for _ in range(50):
+        if cache.local.get("user:42") is None:
+            break
+        await asyncio.sleep(0.01)
+    assert cache.local.get("user:42") is None
+
+
+@pytest.mark.parametrize("name", sorted(codecs.CODECS))
+def test_codecs_round_trip_exact_types(name):
+    value = {
+        "id": uuid.uuid4(),
+        "role": UserRole.ADMIN,
+        "created_at": datetime.now(timezone.utc),
+        "tags": ["a", 1, None, True],
+        "nested": {"ids": [uuid.uuid4()]},
+    }
+    codec = codecs.get_codec(name)
+
+    decoded = codecs.decode(codecs.encode(value, codec))
+    assert decoded == value
+    assert type(decoded["role"]) is UserRole
+
+
+@pytest.mark.parametrize("name", ["json", "msgpack"])
+async def test_unregistered_enum_paths_are_never_called(name, redis_cache, tmp_path):
+    codec = codecs.get_codec(name)
+    target = "os:mkdir"
+    if name == "json":
+        payload = json.dumps(
+            {"$t": "enum", "c": target, "v": str(tmp_path / "pwned")}
+        ).encode()
+    else:
+        ext = msgpack.packb([target, str(tmp_path / "pwned")])
+        payload = msgpack.packb(msgpack.ExtType(codec.EXT_ENUM, ext))
+    stored = bytes((codec.id, 0)) + payload
+
+    with pytest.raises(ValueError):
+        codecs.decode(stored)
+    await (await cache.client()).set("user:evil", stored)
+    assert await cache.get("user:evil") is None
+    assert not (tmp_path / "pwned").exists()
+
+
+def test_unregistered_enums_are_not_encoded():
+    class Color(Enum):
+        RED = "red"
+
+    with pytest.raises(TypeError):
+        codecs.encode({"color": Color.RED}, codecs.get_codec("json"))
+
+
+def test_large_values_are_compressed(monkeypatch):
+    monkeypatch.setattr(settings, "cache_compress_min_bytes", 100)
+    encoded = codecs.encode({"bio": "x" * 1000})
+
+    assert encoded[1] & codecs.COMPRESSED
+    assert len(encoded) < 100
+    assert codecs.decode(encoded) == {"bio": "x" * 1000}
+
+
+def test_untagged_json_values_still_decode():
+    assert codecs.decode(b'{"id": "42"}') == {"id": "42"}
+
+
+async def test_memory_backend_expires_keys():
+    store = MemoryBackend()
+    await store.set("short", "a", px=20)
+    await store.set("long", "b", ex=60)
+    await store.set("short", "c", px=20)
+    assert await store.mget(["short", "long", "missing"]) == [b"c", b"b", None]
+
+    await asyncio.sleep(0.05)
+    assert await store.get("short") is None
+    assert await store.get("long") == b"b"
+    assert store._deadlines == [(store._expires["long"], "long")]
+
+
+async def test_memory_backend_commands():
+    store = MemoryBackend()
+    assert await store.set("lock", "owner", nx=True, px=1000)
+    assert await store.set("lock", "other", nx=True, px=1000) is None
+    assert [await store.incr("n"), await store.incr("n")] == [1, 2]
+
+    await store.zadd("z", {"old": 1, "new": 3, "mid": 2})
+    async with store.pipeline() as pipe:
+        pipe.zremrangebyscore("z", "-inf", "(2")
+        pipe.zrange("z", 0, -1)
+        assert await pipe.execute() == [1, [b"mid", b"new"]]
+
+    received = []
+    async with store.pubsub() as pubsub:
+        await pubsub.subscribe("chan")
+        assert await store.publish("chan", "hello") == 1
+        async for message in pubsub.listen():
+            received.append(message["data"])
+            break
+    assert received == [b"hello"]
+    assert await store.publish("chan", "nobody") == 0
+
+    with pytest.raises(NotImplementedError):
+        store.register_script("return 1")
@@ -0,0 +1,93 @@
+import asyncio
+
+from httpx import ASGITransport, AsyncClient
+
+from app.auth.security import create_access_token
+from app.core.config import settings
+from app.middleware.concurrency import ConcurrencyLimitMiddleware, GradientLimit
+
+
+def test_gradient_limit_grows_under_load_and_backs_off_when_slow():
+    limiter = GradientLimit(initial=10, minimum=2, maximum=100, tolerance=2.0)
+    for _ in range(50):
+        limiter.update(0.01, inflight=int(limiter.limit))
+    grown = limiter.limit
+    assert grown > 10
+
+    for _ in range(50):
+        limiter.update(0.2, inflight=int(limiter.limit))
+    assert limiter.limit < grown / 2
+
+    idle = GradientLimit(initial=10, minimum=2, maximum=100, tolerance=2.0)
+    for _ in range(50):
+        idle.update(0.01, inflight=1)
+    assert idle.limit == 10
+
+
+def _limited_app(monkeypatch, limit: int, admin_reserve: int = 0):
+    monkeypatch.setattr(settings, "concurrency_initial_limit", limit)
+    monkeypatch.setattr(settings, "concurrency_min_limit", limit)
+    monkeypatch.setattr(settings, "concurrency_max_limit", limit)
+    monkeypatch.setattr(settings, "concurrency_max_wait_ms", 20)
+    monkeypatch.setattr(settings, "concurrency_admin_reserve", admin_reserve)
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = ConcurrencyLimitMiddleware(slow_app)
+    client = AsyncClient(transport=ASGITransport(app=middleware), base_url="http://t")
+    return client, release
+
+
+async def test_sheds_with_503_when_saturated_but_not_excluded_paths(monkeypatch):
+    client, release = _limited_app(monkeypatch, limit=1)
+    async with client:
+        first = asyncio.create_task(client.get("/users/me"))
+        await asyncio.sleep(0.01)
+
+        shed = await client.get("/users/me")
+        assert shed.status_code == 503
+        assert shed.headers["Retry-After"] == "1"
+
+        health = asyncio.create_task(client.get("/health"))
+        await asyncio.sleep(0.01)
+        release.set()
+        assert (await health).status_code == 200
+        assert (await first).status_code == 200
+
+
+async def test_admins_use_reserved_slots(monkeypatch):
+    admin = {"Authorization": f"Bearer {create_access_token('admin-id', role='admin')}"}
+    client, release = _limited_app(monkeypatch, limit=1, admin_reserve=1)
+    async with client:
+        first = asyncio.create_task(client.get("/users/me"))
+        await asyncio.sleep(0.01)
+        assert (await client.get("/users/me")).status_code == 503
+
+        admin_request = asyncio.create_task(client.get("/users/", headers=admin))
+        await asyncio.sleep(0.01)
+        release.set()
+        assert (await admin_request).status_code == 200
+        assert (await first).status_code == 200
+
+
+async def test_bulk_routes_have_their_own_limit(monkeypatch):
+    client, release = _limited_app(monkeypatch, limit=1)
+    monkeypatch.setattr(settings, "concurrency_bulk_limit", 1)
+    async with client:
+        export = asyncio.create_task(client.get("/users/export"))
+        await asyncio.sleep(0.01)
+        other = asyncio.create_task(client.get("/users/me"))
+        await asyncio.sleep(0.01)
+
+        shed = await client.post("/users/import")
+        assert shed.status_code == 503
+        assert shed.headers["Retry-After"] == "1"
+
+        release.set()
+        assert (await other).status_code == 200
+        assert (await export).status_code == 200
+        assert (await client.post("/users/import")).status_code == 200
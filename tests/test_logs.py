@@ -0,0 +1,76 @@
+import json
+import queue
+import logging
+
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from app.core.logs import (
+    DroppingQueueHandler,
+    JsonFormatter,
+    RequestContextFilter,
+    SamplingFilter,
+)
+from app.users import routes
+
+
+def _record(level=logging.INFO, msg="hello %s", args=("world",)):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_queue_handler_drops_and_counts_when_full():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    before = REGISTRY.get_sample_value("log_records_dropped_total") or 0
+    handler.handle(_record())
+    handler.handle(_record())
+    assert handler.queue.qsize() == 1
+    assert REGISTRY.get_sample_value("log_records_dropped_total") == before + 1
+    assert handler.queue.get_nowait().msg == "hello world"
+
+
+def test_sampling_keeps_warnings():
+    sampler = SamplingFilter(0.0)
+    assert not sampler.filter(_record(logging.INFO))
+    assert sampler.filter(_record(logging.WARNING))
+
+
+async def test_records_carry_request_context(
+    client: AsyncClient, user_data, monkeypatch
+):
+    records = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    capture = Capture()
+    capture.addFilter(RequestContextFilter())
+    logger = logging.getLogger("tests.request_context")
+    logger.addHandler(capture)
+    user_response = routes._user_response
+
+    def logged_user_response(request, user):
+        logger.warning("serving %s", user["username"])
+        return user_response(request, user)
+
+    monkeypatch.setattr(routes, "_user_response", logged_user_response)
+    try:
+        await client.post("/auth/register", json=user_data)
+        login = await client.post(
+            "/auth/login",
+            json={"username": user_data["username"], "password": "testpassword123"},
+        )
+        headers = {
+            "Authorization": f"Bearer {login.json()['access_token']}",
+            "X-Request-ID": "log-ctx-1",
+        }
+        me = await client.get("/users/me", headers=headers)
+    finally:
+        logger.removeHandler(capture)
+
+    assert len(records) == 1
+    line = json.loads(JsonFormatter().format(records[0]))
+    assert line["message"] == "serving testuser"
+    assert line["request_id"] == "log-ctx-1"
+    assert line["route"] == "/users/me"
+    assert line["user_id"] == me.json()["id"]
@@ -0,0 +1,73 @@
+import os
+import sys
+import runpy
+import subprocess
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+WORKER = """
+import os
+from app.metrics import concurrency_limit, http_requests
+
+http_requests.labels("GET", "/health", "200").inc()
+concurrency_limit.set(10)
+print(os.getpid())
+"""
+
+SCRAPE = """
+import sys
+import asyncio
+import runpy
+
+from types import SimpleNamespace
+from httpx import ASGITransport, AsyncClient
+
+child_exit = runpy.run_path("gunicorn.conf.py")["child_exit"]
+child_exit(None, SimpleNamespace(pid=int(sys.argv[1])))
+
+from app.metrics import metrics_app
+
+
+async def scrape():
+    transport = ASGITransport(app=metrics_app())
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        print((await client.get("/metrics")).text)
+
+
+asyncio.run(scrape())
+"""
+
+
+def _run(code: str, directory: Path, *args: str) -> str:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(directory)}
+    return subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def test_multiprocess_scrape_sums_workers_and_drops_dead_gauges(tmp_path):
+    pids = [_run(WORKER, tmp_path).strip() for _ in range(2)]
+
+    # The second worker exits; gunicorn's child_exit removes its live gauges.
+    scraped = _run(SCRAPE, tmp_path, pids[1])
+
+    requests = 'http_requests_total{method="GET",path="/health",status="200"}'
+    assert f"{requests} 2.0" in scraped
+    assert "concurrency_limit 10.0" in scraped
+
+
+def test_gunicorn_start_clears_only_sample_files(tmp_path, monkeypatch):
+    (tmp_path / "counter_1.db").write_bytes(b"")
+    (tmp_path / "unrelated.txt").write_text("keep")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    runpy.run_path(str(ROOT / "gunicorn.conf.py"))["on_starting"](None)
+
+    assert [path.name for path in tmp_path.iterdir()] == ["unrelated.txt"]
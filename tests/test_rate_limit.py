@@ -19,3 +19,38 @@ async def test_rate_limit_headers_on_auth(client: AsyncClient, user_data):
     # Headers present when Redis is available
     if "X-RateLimit-Remaining" in r.headers:
         assert int(r.headers["X-RateLimit-Remaining"]) >= 0
+
+
+async def test_login_costs_more_than_default(client: AsyncClient, redis_cache):
+    r = await client.get("/users/me")
+    assert int(r.headers["X-RateLimit-Remaining"]) == 59
+
+    r = await client.post("/auth/login", json={"username": "x", "password": "y"})
+    # The per-route login bucket (10/min) is now the binding one.
+    assert r.headers["X-RateLimit-Limit"] == "10"
+    assert int(r.headers["X-RateLimit-Remaining"]) == 9
+
+    r = await client.get("/users/me")
+    assert int(r.headers["X-RateLimit-Remaining"]) == 53
+
+
+async def test_rate_limit_exceeded_returns_retry_after(
+    client: AsyncClient, redis_cache
+):
+    for _ in range(10):
+        r = await client.post("/auth/login", json={"username": "x", "password": "y"})
+        assert r.status_code == 401
+
+    r = await client.post(
+        "/auth/login",
+        json={"username": "x", "password": "y"},
+        headers={"X-Request-ID": "throttled-1"},
+    )
+    assert r.status_code == 429
+    assert r.headers["X-RateLimit-Remaining"] == "0"
+    assert r.headers["X-Request-ID"] == "throttled-1"
+    assert int(r.headers["Retry-After"]) >= 1
+
+    # A denied request consumes nothing from the other buckets.
+    r = await client.get("/users/me")
+    assert int(r.headers["X-RateLimit-Remaining"]) >= 9
@@ -0,0 +1,102 @@
+import uuid
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import cache, startup
+from app.core.config import settings
+from app.core.database import create_engine
+from app.core.startup import ensure_schema, schema_state
+from app.users.service import preload_recent_users
+from tests.conftest import TestSession, TEST_DB
+
+
+@pytest_asyncio.fixture
+async def engine():
+    created = create_engine(TEST_DB, "startup-test")
+    yield created
+    async with created.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS schema_fingerprint"))
+    await created.dispose()
+
+
+async def test_schema_fingerprint_is_stored_and_checked(engine, monkeypatch):
+    monkeypatch.setattr(settings, "db_schema_mode", "check")
+    with pytest.raises(RuntimeError):
+        await ensure_schema(engine)
+
+    monkeypatch.setattr(settings, "db_schema_mode", "create")
+    await ensure_schema(engine)
+    async with engine.connect() as conn:
+        stored = await conn.scalar(text("SELECT fingerprint FROM schema_fingerprint"))
+    assert stored == startup.schema_fingerprint(engine.dialect)
+
+    monkeypatch.setattr(settings, "db_schema_mode", "check")
+    await ensure_schema(engine)
+
+    async with engine.begin() as conn:
+        await conn.execute(update(schema_state).values(fingerprint="stale"))
+    with pytest.raises(RuntimeError):
+        await ensure_schema(engine)
+
+
+async def test_auto_never_records_a_schema_it_did_not_create(
+    engine, monkeypatch, caplog
+):
+    # The users table already exists, so create_all can't apply new columns
+    # or indexes to it.
+    monkeypatch.setattr(settings, "db_schema_mode", "auto")
+    await ensure_schema(engine)
+    async with engine.begin() as conn:
+        assert await conn.scalar(select(schema_state.c.fingerprint)) is None
+        await conn.execute(
+            insert(schema_state).values(fingerprint="stale", applied_at=func.now())
+        )
+
+    await ensure_schema(engine)
+    async with engine.connect() as conn:
+        assert await conn.scalar(select(schema_state.c.fingerprint)) == "stale"
+    assert "need a migration" in caplog.text
+
+
+async def test_auto_records_the_schema_it_creates(monkeypatch):
+    name = f"startup_{uuid.uuid4().hex[:8]}"
+    admin = create_async_engine(TEST_DB, isolation_level="AUTOCOMMIT")
+    try:
+        async with admin.connect() as conn:
+            await conn.execute(text(f"CREATE DATABASE {name}"))
+    except DBAPIError:
+        await admin.dispose()
+        pytest.skip("Cannot create a scratch database")
+    empty = create_engine(TEST_DB.rsplit("/", 1)[0] + f"/{name}", "startup-empty")
+    try:
+        monkeypatch.setattr(settings, "db_schema_mode", "auto")
+        await ensure_schema(empty)
+        monkeypatch.setattr(settings, "db_schema_mode", "check")
+        await ensure_schema(empty)
+    finally:
+        await empty.dispose()
+        async with admin.connect() as conn:
+            await conn.execute(text(f"DROP DATABASE {name}"))
+        await admin.dispose()
+
+
+async def test_preload_recent_users(client: AsyncClient, user_data, redis_cache):
+    user_id = (await client.post("/auth/register", json=user_data)).json()["id"]
+    async with TestSession() as db:
+        assert await preload_recent_users(db, 10) == 1
+    cache.local.clear()
+    cached = await cache.get_many([f"user:{user_id}"], operation="get_user")
+    assert cached[f"user:{user_id}"]["username"] == "testuser"
+
+
+async def test_first_request_duration_is_recorded(client: AsyncClient):
+    await client.get("/health")
+    assert REGISTRY.get_sample_value(
+        "http_first_request_duration_seconds", {"method": "GET", "path": "/health"}
+    )
@@ -1,4 +1,15 @@
+import json
+
+from itertools import product
+
 from httpx import AsyncClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.users.models import User, UserRole
+from app.users.service import _filtered_users, iter_lines
+from tests.conftest import test_engine
 
 
 async def _auth_headers(client, user_data):
@@ -49,3 +60,307 @@ async def test_admin_can_list(client: AsyncClient):
     r = await client.get("/users/", headers=headers)
     assert r.status_code == 200
     assert isinstance(r.json(), list)
+
+
+async def test_read_user_reflects_update(client: AsyncClient, user_data, redis_cache):
+    headers = await _auth_headers(client, user_data)
+    me = (await client.get("/users/me", headers=headers)).json()
+
+    r = await client.get(f"/users/{me['id']}", headers=headers)
+    assert r.json()["full_name"] == user_data["full_name"]
+
+    await client.put("/users/me", json={"full_name": "Updated"}, headers=headers)
+    r = await client.get(f"/users/{me['id']}", headers=headers)
+    assert r.json()["full_name"] == "Updated"
+
+
+async def test_deactivated_user_is_rejected(
+    client: AsyncClient, user_data, redis_cache
+):
+    headers = await _auth_headers(client, user_data)
+    me = (await client.get("/users/me", headers=headers)).json()
+    admin_headers = await _auth_headers(
+        client,
+        {
+            "email": "admin@example.com",
+            "username": "adminuser",
+            "password": "adminpass123",
+            "role": "admin",
+        },
+    )
+
+    r = await client.delete(f"/users/{me['id']}", headers=admin_headers)
+    assert r.status_code == 204
+
+    r = await client.get("/users/me", headers=headers)
+    assert r.status_code == 403
+
+
+async def test_admin_list_cursor_pagination(client: AsyncClient):
+    admin_data = {
+        "email": "admin@example.com",
+        "username": "adminuser",
+        "password": "adminpass123",
+        "role": "admin",
+    }
+    headers = await _auth_headers(client, admin_data)
+    for i in range(2):
+        await client.post(
+            "/auth/register",
+            json={
+                "email": f"user{i}@example.com",
+                "username": f"user{i}",
+                "password": "userpass123",
+            },
+        )
+
+    r = await client.get("/users/", params={"limit": 2}, headers=headers)
+    first_page = [user["username"] for user in r.json()]
+    assert first_page == ["adminuser", "user0"]
+    cursor = r.headers["X-Next-Cursor"]
+
+    r = await client.get(
+        "/users/", params={"limit": 2, "cursor": cursor}, headers=headers
+    )
+    assert [user["username"] for user in r.json()] == ["user1"]
+    assert "X-Next-Cursor" not in r.headers
+
+    r = await client.get(
+        "/users/", params={"role": "admin", "is_active": True}, headers=headers
+    )
+    assert [user["username"] for user in r.json()] == ["adminuser"]
+
+
+async def test_every_listing_filter_reads_an_ordered_index():
+    async with test_engine.connect() as conn:
+        # Make the planner pick an index whenever one can serve the query, so
+        # the plan doesn't depend on the (tiny) table size.
+        await conn.execute(text("SET LOCAL enable_seqscan = off"))
+        await conn.execute(text("SET LOCAL enable_sort = off"))
+        for role, is_active in product([None, UserRole.ADMIN], [None, False]):
+            query = _filtered_users(role, is_active, User.id).limit(50)
+            compiled = query.compile(
+                dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+            )
+            plan = "\n".join(
+                (await conn.execute(text(f"EXPLAIN {compiled}"))).scalars()
+            )
+            assert "Sort" not in plan, plan
+            if role or is_active is not None:
+                assert "Index Cond" in plan, plan
+
+
+async def test_admin_list_rejects_tampered_cursor(client: AsyncClient):
+    admin_data = {
+        "email": "admin@example.com",
+        "username": "adminuser",
+        "password": "adminpass123",
+        "role": "admin",
+    }
+    headers = await _auth_headers(client, admin_data)
+    r = await client.get("/users/", params={"cursor": "abc.def"}, headers=headers)
+    assert r.status_code == 400
+
+
+async def test_admin_bulk_import_reports_row_errors(client: AsyncClient, user_data):
+    await client.post("/auth/register", json=user_data)
+    headers = await _auth_headers(
+        client,
+        {
+            "email": "admin@example.com",
+            "username": "adminuser",
+            "password": "adminpass123",
+            "role": "admin",
+        },
+    )
+    body = "\n".join(
+        [
+            '{"email": "new@example.com", "username": "newuser",'
+            ' "password": "newpass123"}',
+            '{"email": "test@example.com", "username": "other",'
+            ' "password": "newpass123"}',
+            '{"email": "bad", "username": "baduser", "password": "newpass123"}',
+            "not json",
+        ]
+    )
+    r = await client.post(
+        "/users/import",
+        content=body,
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert r.status_code == 200
+    result = r.json()
+    assert result["inserted"] == 1
+    assert result["failed"] == 3
+    assert [error["line"] for error in result["errors"]] == [3, 4, 2]
+
+    r = await client.post(
+        "/auth/login", json={"username": "newuser", "password": "newpass123"}
+    )
+    assert r.status_code == 200
+
+
+async def test_admin_bulk_import_rejects_bad_lines_per_row(
+    client: AsyncClient, monkeypatch
+):
+    monkeypatch.setattr(settings, "import_max_line_bytes", 200)
+    headers = await _auth_headers(
+        client,
+        {
+            "email": "admin@example.com",
+            "username": "adminuser",
+            "password": "adminpass123",
+            "role": "admin",
+        },
+    )
+    good = (
+        b'{"email": "new@example.com", "username": "newuser", "password": "newpass123"}'
+    )
+    long_name = json.dumps(
+        {
+            "email": "long@example.com",
+            "username": "longname",
+            "password": "newpass123",
+            "full_name": "x" * 101,
+        }
+    ).encode()
+    body = b"\n".join([b"\xff\xfe not utf-8", b"x" * 1000, long_name, good])
+    r = await client.post(
+        "/users/import",
+        content=body,
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert r.status_code == 200
+    result = r.json()
+    assert result["inserted"] == 1
+    assert [error["line"] for error in result["errors"]] == [1, 2, 3]
+
+
+async def test_iter_lines_splits_across_chunks():
+    async def chunks():
+        for chunk in (b"ab", b"c\nde", b"\r\n\nf"):
+            yield chunk
+
+    assert [line async for line in iter_lines(chunks())] == [b"abc", b"de\r", b"", b"f"]
+
+
+async def test_admin_bulk_import_csv(client: AsyncClient):
+    headers = await _auth_headers(
+        client,
+        {
+            "email": "admin@example.com",
+            "username": "adminuser",
+            "password": "adminpass123",
+            "role": "admin",
+        },
+    )
+    body = (
+        "email,username,password,full_name\n"
+        "a@example.com,usera,password123,\n"
+        'b@example.com,userb,password123,"B, Jr."\n'
+    )
+    r = await client.post(
+        "/users/import", content=body, headers={**headers, "Content-Type": "text/csv"}
+    )
+    assert r.json() == {"inserted": 2, "failed": 0, "errors": []}
+
+
+async def test_admin_export_streams_ndjson_and_csv(client: AsyncClient, user_data):
+    await client.post("/auth/register", json=user_data)
+    headers = await _auth_headers(
+        client,
+        {
+            "email": "admin@example.com",
+            "username": "adminuser",
+            "password": "adminpass123",
+            "role": "admin",
+        },
+    )
+
+    r = await client.get("/users/export", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["username"] for row in rows] == ["testuser", "adminuser"]
+    assert "hashed_password" not in rows[0]
+
+    r = await client.get(
+        "/users/export", params={"format": "csv", "role": "admin"}, headers=headers
+    )
+    lines = r.text.splitlines()
+    assert lines[0] == "id,email,username,full_name,is_active,role,created_at"
+    assert len(lines) == 2
+    assert ",adminuser," in lines[1]
+
+
+async def test_batch_lookup_preserves_order_and_reports_missing(
+    client: AsyncClient, user_data, redis_cache
+):
+    headers = await _auth_headers(client, user_data)
+    me = (await client.get("/users/me", headers=headers)).json()
+    other_headers = await _auth_headers(
+        client,
+        {"email": "other@example.com", "username": "other", "password": "otherpass1"},
+    )
+    other = (await client.get("/users/me", headers=other_headers)).json()
+    unknown = "00000000-0000-0000-0000-000000000000"
+
+    for _ in range(2):  # cold, then served from cache
+        r = await client.get(
+            "/users/batch",
+            params=[("ids", other["id"]), ("ids", unknown), ("ids", me["id"])],
+            headers=headers,
+        )
+        assert r.status_code == 200
+        assert [user["username"] for user in r.json()["users"]] == ["other", "testuser"]
+        assert r.json()["missing"] == [unknown]
+
+
+async def test_metrics_use_route_templates(client: AsyncClient, user_data):
+    headers = await _auth_headers(client, user_data)
+    me = (await client.get("/users/me", headers=headers)).json()
+    await client.get(f"/users/{me['id']}", headers=headers)
+    await client.get("/no/such/path")
+
+    def count(path, status):
+        return REGISTRY.get_sample_value(
+            "http_requests_total", {"method": "GET", "path": path, "status": status}
+        )
+
+    assert count("/users/{user_id}", "200") >= 1
+    assert count(f"/users/{me['id']}", "200") is None
+    assert count("unmatched", "404") >= 1
+    assert REGISTRY.get_sample_value(
+        "http_request_duration_seconds_count",
+        {"method": "GET", "path": "/users/{user_id}"},
+    )
+
+
+async def test_conditional_get_returns_304_until_user_changes(
+    client: AsyncClient, user_data, redis_cache
+):
+    headers = await _auth_headers(client, user_data)
+    r = await client.get("/users/me", headers=headers)
+    user_id, etag = r.json()["id"], r.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert "no-cache" in r.headers["Cache-Control"]
+
+    r = await client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["ETag"] == etag
+
+    r = await client.get(
+        f"/users/{user_id}",
+        headers={**headers, "If-None-Match": etag.removeprefix("W/")},
+    )
+    assert r.status_code == 304
+
+    updated = await client.put(
+        "/users/me", json={"full_name": "Changed"}, headers=headers
+    )
+    assert updated.headers["ETag"] != etag
+    r = await client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Changed"
+    assert r.headers["ETag"] == updated.headers["ETag"]